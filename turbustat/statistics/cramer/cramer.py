@@ -8,6 +8,7 @@ Implementation of the Cramer Statistic
 '''
 
 import numpy as np
+from scipy.special import gammaln
 from sklearn.metrics.pairwise import pairwise_distances
 
 from ..threeD_to_twoD import _format_data
@@ -67,93 +68,262 @@ class Cramer_Distance(object):
 
         if samps1 != samps2:
 
-            # Set the seed due to the sampling
-            np.random.seed(seed)
+            # A single seeded generator is used for the sampling
+            rng = np.random.RandomState(seed)
 
             if samps1 < samps2:
-
-                new_data = np.empty((self.data_matrix2.shape[0], samps1))
-
-                for i in range(self.data_matrix2.shape[0]):
-                    new_data[i, :] = \
-                        np.random.choice(self.data_matrix2[i, :], samps1,
-                                         replace=False)
-
-                self.data_matrix2 = new_data
-
+                self.data_matrix2 = \
+                    _subsample_columns(self.data_matrix2, samps1, rng)
             else:
+                self.data_matrix1 = \
+                    _subsample_columns(self.data_matrix1, samps2, rng)
 
-                new_data = np.empty((self.data_matrix1.shape[0], samps2))
-
-                for i in range(self.data_matrix1.shape[0]):
-                    new_data[i, :] = \
-                        np.random.choice(self.data_matrix1[i, :], samps2,
-                                         replace=False)
-
-                self.data_matrix1 = new_data
-
-    def cramer_statistic(self, n_jobs=1):
+    def cramer_statistic(self, n_jobs=1, block_size=256, method='exact',
+                         n_projections=128, seed=None):
         '''
         Applies the Cramer Statistic to the datasets.
 
+        The sums of the pairwise distances within and between the data
+        matrices are accumulated over blocks of rows, so only a block of
+        each distance matrix is held at a time.
+
+        With `method='projection'`, the sums are estimated from random 1D
+        projections of the rows. The mean distance between two points in d
+        dimensions is c_d times the mean over directions of the distance
+        between their projections (c_d = sqrt(pi) Gamma((d + 1) / 2) /
+        Gamma(d / 2)), and the sum of pairwise distances of a 1D sample
+        follows from sorting it. This costs O((m + n) d L) for L projections
+        instead of O((m + n)^2 d). The standard error of the estimate over
+        the projections is kept in `distance_err`.
+
         Parameters
         ----------
 
         n_jobs : int, optional
             Sets the number of cores to use to calculate
             pairwise distances
+        block_size : int, optional
+            Number of rows in each block of the distance matrices.
+        method : {'exact', 'projection'}, optional
+            Compute the exact statistic or the random projection estimate.
+        n_projections : int, optional
+            Number of random directions used with `method='projection'`.
+            The error decreases as 1 / sqrt(n_projections).
+        seed : int, optional
+            Seed for the random directions.
+        '''
+
+        m = self.data_matrix1.shape[0]
+        n = self.data_matrix2.shape[0]
+
+        if method == 'projection':
+            distances = _projected_cramer(self.data_matrix1,
+                                          self.data_matrix2,
+                                          n_projections=n_projections,
+                                          seed=seed)
+            self.distance = distances.mean()
+            self.distance_err = distances.std() / np.sqrt(n_projections)
+            return
+        elif method != 'exact':
+            raise ValueError("method must be 'exact' or 'projection'.")
+
+        term1 = _pairwise_distance_sum(self.data_matrix1, self.data_matrix2,
+                                       block_size=block_size, n_jobs=n_jobs)
+        term2 = _pairwise_distance_sum(self.data_matrix1, self.data_matrix1,
+                                       block_size=block_size, n_jobs=n_jobs)
+        term3 = _pairwise_distance_sum(self.data_matrix2, self.data_matrix2,
+                                       block_size=block_size, n_jobs=n_jobs)
+
+        self.distance = _cramer_from_sums(term1, term2, term3, m, n)
+
+    def permutation_test(self, n_permutations=1000, batch_size=100,
+                         n_jobs=1, seed=None):
+        '''
+        Estimate the significance of the Cramer statistic by randomly
+        reassigning the rows of both data matrices to the two samples.
+
+        The pairwise distances of the pooled rows are computed once. For a
+        batch of permutations given as rows of a 0/1 membership matrix A,
+        the within- and between-sample sums are the row sums of
+        (A D) * A, (A D) * (1 - A) and ((1 - A) D) * (1 - A), so each
+        permutation only costs sums over the distance matrix.
+
+        Parameters
+        ----------
+        n_permutations : int, optional
+            Number of permutations.
+        batch_size : int, optional
+            Number of permutations evaluated together.
+        n_jobs : int, optional
+            Number of threads used to evaluate the batches and cores used
+            to compute the pairwise distances.
+        seed : int, optional
+            Seed for the permutations.
         '''
-        # Adjust what we call n,m based on the larger dimension.
-        # Then the looping below is valid.
-        if self.data_matrix1.shape[0] >= self.data_matrix2.shape[0]:
-            m = self.data_matrix1.shape[0]
-            n = self.data_matrix2.shape[0]
-            larger = self.data_matrix1
-            smaller = self.data_matrix2
+
+        if self.data_matrix1 is None or self.data_matrix2 is None:
+            self.format_data()
+
+        m = self.data_matrix1.shape[0]
+        n = self.data_matrix2.shape[0]
+
+        pooled_distances = \
+            pairwise_distances(np.vstack([self.data_matrix1,
+                                          self.data_matrix2]),
+                               metric="euclidean", n_jobs=n_jobs)
+
+        # The observed split: the first m rows belong to the first sample.
+        membership = np.zeros((1, m + n))
+        membership[0, :m] = 1.
+        observed = _permuted_cramer(pooled_distances, membership)[0]
+
+        rng = np.random.RandomState(seed)
+
+        batches = []
+        for start in range(0, n_permutations, batch_size):
+            num = min(batch_size, n_permutations - start)
+            keys = rng.random_sample((num, m + n))
+            # Rank the random keys. The m smallest go to the first sample.
+            ranks = np.argsort(np.argsort(keys, axis=1), axis=1)
+            batches.append((ranks < m).astype(float))
+
+        def evaluate(batch):
+            return _permuted_cramer(pooled_distances, batch)
+
+        if n_jobs == 1:
+            results = [evaluate(batch) for batch in batches]
         else:
-            n = self.data_matrix1.shape[0]
-            m = self.data_matrix2.shape[0]
-            larger = self.data_matrix2
-            smaller = self.data_matrix1
-
-        pairdist11 = pairwise_distances(
-            larger, metric="euclidean", n_jobs=n_jobs)
-        pairdist22 = pairwise_distances(
-            smaller, metric="euclidean", n_jobs=n_jobs)
-        pairdist12 = pairwise_distances(
-            larger, smaller,
-            metric="euclidean", n_jobs=n_jobs)
-
-        term1 = 0.0
-        term2 = 0.0
-        term3 = 0.0
-        for i in range(m):
-            for j in range(n):
-                term1 += pairdist12[i, j]
-            for ii in range(m):
-                term2 += pairdist11[i, ii]
-
-            if i < n:
-                for jj in range(n):
-                    term3 += pairdist22[i, jj]
-
-        m, n = float(m), float(n)
-
-        term1 *= (1 / (m * n))
-        term2 *= (1 / (2 * m ** 2.))
-        term3 *= (1 / (2 * n ** 2.))
-
-        self.distance = (m * n / (m + n)) * (term1 - term2 - term3)
-
-    def distance_metric(self, n_jobs=1):
+            from multiprocessing.pool import ThreadPool
+
+            pool = ThreadPool(n_jobs)
+            try:
+                results = pool.map(evaluate, batches)
+            finally:
+                pool.close()
+                pool.join()
+
+        self.permutation_distances = np.concatenate(results)
+
+        self.permutation_pval = \
+            (np.sum(self.permutation_distances >= observed) + 1.) / \
+            (n_permutations + 1.)
+
+    def distance_metric(self, n_jobs=1, method='exact', n_projections=128,
+                        seed=None, block_size=256):
         '''
 
         This serves as a simple wrapper in order to remain with the coding
-        convention used throughout the rest of this project.
+        convention used throughout the rest of this project. `method`,
+        `n_projections`, `seed` and `block_size` are passed to
+        `cramer_statistic`.
 
         '''
 
         self.format_data()
-        self.cramer_statistic(n_jobs=n_jobs)
+        self.cramer_statistic(n_jobs=n_jobs, block_size=block_size,
+                              method=method, n_projections=n_projections,
+                              seed=seed)
 
         return self
+
+
+def _subsample_columns(data, num_samples, rng):
+    '''
+    Draw `num_samples` values from each row without replacement. The draws
+    for all rows are made at once by ranking uniform random keys.
+    '''
+
+    keys = rng.random_sample(data.shape)
+    posns = np.argsort(keys, axis=1)[:, :num_samples]
+
+    return data[np.arange(data.shape[0])[:, np.newaxis], posns]
+
+
+def _cramer_from_sums(sum12, sum11, sum22, m, n):
+    '''
+    Cramer statistic from the sums of the pairwise distances between and
+    within the two samples of sizes m and n.
+    '''
+
+    m, n = float(m), float(n)
+
+    term1 = sum12 * (1 / (m * n))
+    term2 = sum11 * (1 / (2 * m ** 2.))
+    term3 = sum22 * (1 / (2 * n ** 2.))
+
+    return (m * n / (m + n)) * (term1 - term2 - term3)
+
+
+def _permuted_cramer(pooled_distances, membership):
+    '''
+    Cramer statistics for splits of the pooled rows. Each row of
+    `membership` is 1 for rows in the first sample and 0 otherwise.
+    '''
+
+    other = 1. - membership
+
+    proj = np.dot(membership, pooled_distances)
+    sum11 = (proj * membership).sum(1)
+    sum12 = (proj * other).sum(1)
+    sum22 = (np.dot(other, pooled_distances) * other).sum(1)
+
+    m = membership[0].sum()
+    n = other[0].sum()
+
+    return _cramer_from_sums(sum12, sum11, sum22, m, n)
+
+
+def _projected_cramer(data1, data2, n_projections=128, seed=None):
+    '''
+    Cramer statistics estimated from each of `n_projections` random 1D
+    projections of the rows. Their mean is an unbiased estimate of the
+    statistic.
+    '''
+
+    m = data1.shape[0]
+    n = data2.shape[0]
+    dims = data1.shape[1]
+
+    rng = np.random.RandomState(seed)
+    directions = rng.standard_normal((dims, n_projections))
+    directions /= np.sqrt((directions ** 2).sum(0))
+
+    # Mean distance over random directions relative to the full distance.
+    scale = np.sqrt(np.pi) * np.exp(gammaln((dims + 1) / 2.) -
+                                    gammaln(dims / 2.))
+
+    proj1 = np.dot(data1, directions)
+    proj2 = np.dot(data2, directions)
+
+    sum11 = _sorted_pair_sum(proj1)
+    sum22 = _sorted_pair_sum(proj2)
+    sum12 = (_sorted_pair_sum(np.vstack([proj1, proj2])) - sum11 - sum22) / 2.
+
+    return scale * _cramer_from_sums(sum12, sum11, sum22, m, n)
+
+
+def _sorted_pair_sum(values):
+    '''
+    Sum of |x_i - x_j| over all ordered pairs in each column. After
+    sorting, the k-th smallest of N values appears with a positive sign in k
+    pairs and a negative sign in N - 1 - k pairs.
+    '''
+
+    num = values.shape[0]
+    weights = 2 * np.arange(num) - num + 1
+
+    return 2 * np.dot(weights, np.sort(values, axis=0))
+
+
+def _pairwise_distance_sum(X, Y, block_size=256, n_jobs=1):
+    '''
+    Sum of the Euclidean distances between all rows of X and all rows of Y,
+    computed over blocks of rows of X.
+    '''
+
+    total = 0.0
+    for start in range(0, X.shape[0], block_size):
+        total += pairwise_distances(X[start:start + block_size], Y,
+                                    metric="euclidean", n_jobs=n_jobs).sum()
+
+    return total
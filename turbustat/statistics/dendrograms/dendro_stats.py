@@ -85,11 +85,13 @@ class Dendrogram_Stats(BaseStatisticMixIn):
             self.min_deltas = min_deltas
 
         self.numfeatures = np.empty(self.min_deltas.shape)
-        self.values = []
+        self.value_array = None
+        self.value_offsets = None
         self.histograms = []
 
     def compute_dendro(self, verbose=False, save_dendro=False,
-                       dendro_name=None, dendro_obj=None):
+                       dendro_name=None, dendro_obj=None,
+                       sequential_prune=False):
         '''
         Compute the dendrogram and prune to the minimum deltas.
         ** min_deltas must be in ascending order! **
@@ -106,6 +108,11 @@ class Dendrogram_Stats(BaseStatisticMixIn):
         dendro_obj : Dendrogram, optional
             Input a pre-computed dendrogram object. It is assumed that
             the dendrogram has already been computed!
+        sequential_prune : bool, optional
+            Prune the dendrogram with astrodendro at each min_delta. By
+            default, the min_delta at which each structure is pruned and its
+            peak at each stage are found in one traversal of the tree (see
+            `_pruning_thresholds`), and the dendrogram is left unpruned.
 
         '''
 
@@ -118,20 +125,83 @@ class Dendrogram_Stats(BaseStatisticMixIn):
         else:
             d = dendro_obj
         self.numfeatures[0] = len(d)
-        self.values.append(
-            np.asarray([struct.vmax for struct in d.all_structures]))
+        first_values = np.array([struct.vmax for struct in d.all_structures])
 
-        if len(self.min_deltas) > 1:
+        if len(self.min_deltas) > 1 and sequential_prune:
+            values = [first_values]
             for i, delta in enumerate(self.min_deltas[1:]):
                 if verbose:
                     print "On %s of %s" % (i + 1, len(self.min_deltas[1:]))
                 d.prune(min_delta=delta)
                 self.numfeatures[i + 1] = len(d)
-                self.values.append([struct.vmax for struct in
-                                    d.all_structures])
+                values.append([struct.vmax for struct in d.all_structures])
+
+            self.value_array = np.concatenate(values)
+            self.value_offsets = \
+                np.append(0, np.cumsum(self.numfeatures)).astype(int)
+
+        elif len(self.min_deltas) > 1:
+            death_deltas, starts, ends, peaks = _pruning_thresholds(d)
+
+            # A structure is kept while min_delta <= its death delta.
+            self.numfeatures[1:] = death_deltas.size - \
+                np.searchsorted(np.sort(death_deltas), self.min_deltas[1:],
+                                side='left')
+
+            # Each vmax is kept for the min_deltas in (start, end].
+            deltas = self.min_deltas[1:]
+            first = np.searchsorted(deltas, starts, side='right')
+            last = np.searchsorted(deltas, ends, side='right')
+            repeats = np.maximum(last - first, 0)
+
+            # Order the repeated values by min_delta.
+            delta_posns = np.repeat(first - np.cumsum(repeats) + repeats,
+                                    repeats) + np.arange(repeats.sum())
+            order = np.argsort(delta_posns, kind='mergesort')
+
+            self.value_array = \
+                np.append(first_values, np.repeat(peaks, repeats)[order])
+            self.value_offsets = \
+                np.append(0, np.cumsum(self.numfeatures)).astype(int)
+
+        else:
+            self.value_array = first_values
+            self.value_offsets = np.array([0, first_values.size])
 
         return self
 
+    @property
+    def values(self):
+        '''
+        The vmax of every structure at each min_delta. These are views into
+        `value_array`, which holds the values for all min_deltas in order.
+        The values for min_deltas[i] are
+        value_array[value_offsets[i]:value_offsets[i + 1]].
+        '''
+        return [self.value_array[start:end] for start, end in
+                zip(self.value_offsets[:-1], self.value_offsets[1:])]
+
+    def __setstate__(self, state):
+        '''
+        Convert the `values` list in pickles saved before the values were
+        stored as `value_array` and `value_offsets`.
+        '''
+
+        if "values" in state:
+            values = state.pop("values")
+
+            if len(values) > 0:
+                values = [np.asarray(vals, dtype=float) for vals in values]
+                state["value_array"] = np.concatenate(values)
+                state["value_offsets"] = \
+                    np.append(0, np.cumsum([vals.size for vals in
+                                            values])).astype(int)
+            else:
+                state["value_array"] = None
+                state["value_offsets"] = None
+
+        self.__dict__.update(state)
+
     def make_hist(self):
         '''
         Creates histograms based on values from the tree.
@@ -572,6 +642,121 @@ class DendroDistance(object):
         return self
 
 
+def _pruning_thresholds(dendrogram):
+    '''
+    Find when each structure is removed as a dendrogram is pruned to larger
+    min_delta values, and its vmax at each stage, from one traversal of the
+    unpruned tree.
+
+    Pruning a leaf merges it into its parent. When the parent has two
+    children, the sibling is merged too and the parent takes on the
+    sibling's children, so the heights of the remaining structures above
+    their parents do not change. Each structure is then removed at the
+    smallest min_delta that prunes one of the leaves it merges with, and a
+    branch becomes a leaf once all of its sub-structure is merged. The
+    structures are visited from the leaves to the trunk.
+
+    Parameters
+    ----------
+    dendrogram : astrodendro.Dendrogram
+        Unpruned dendrogram.
+
+    Returns
+    -------
+    death_deltas : numpy.ndarray
+        Largest min_delta each structure survives.
+    starts : numpy.ndarray
+        Start of the min_delta interval, (starts, ends], of each value.
+    ends : numpy.ndarray
+        End of the min_delta interval of each value.
+    peaks : numpy.ndarray
+        vmax of the structure over the interval.
+    '''
+
+    structures = list(dendrogram.all_structures)
+
+    # min_delta where a structure becomes a leaf, its peak once all
+    # sub-structure has merged, and its vmax steps as (start, value).
+    leaf_deltas = {}
+    peaks = {}
+    steps = {}
+    death_deltas = {}
+
+    # Children come after their parents in prefix order.
+    for struct in structures[::-1]:
+        if struct.is_leaf:
+            leaf_deltas[struct.idx] = -np.inf
+            peaks[struct.idx] = struct.vmax
+            steps[struct.idx] = [(-np.inf, struct.vmax)]
+            continue
+
+        children = list(struct.children)
+        level = -np.inf
+        vmax = struct.vmax
+        struct_steps = [(-np.inf, struct.vmax)]
+
+        # With more than two children, pruned leaves merge alone. The height
+        # of the branch can rise as they are removed.
+        while True:
+            height = min(child.vmin for child in children)
+            prune_deltas = [max(leaf_deltas[child.idx],
+                                peaks[child.idx] - height)
+                            for child in children]
+            pruned = int(np.argmin(prune_deltas))
+            level = max(level, prune_deltas[pruned])
+
+            if len(children) == 2:
+                break
+
+            child = children.pop(pruned)
+            death_deltas[child.idx] = level
+            vmax = max(vmax, peaks[child.idx])
+            struct_steps.append((level, vmax))
+
+        # Both remaining children merge, and the sibling's children are
+        # taken on. The vmax then follows the sibling's vmax.
+        sibling = children[1 - pruned]
+        for child in children:
+            death_deltas[child.idx] = level
+
+        vmax = max(vmax, peaks[children[pruned].idx])
+        sibling_steps = steps[sibling.idx]
+        for i, (start, value) in enumerate(sibling_steps):
+            if i + 1 < len(sibling_steps) and sibling_steps[i + 1][0] <= level:
+                continue
+            struct_steps.append((max(start, level), max(vmax, value)))
+
+        leaf_deltas[struct.idx] = max(level, leaf_deltas[sibling.idx])
+        peaks[struct.idx] = max([struct.vmax] +
+                                [peaks[child.idx] for child in
+                                 struct.children])
+        steps[struct.idx] = struct_steps
+
+    # Leaves in the trunk are removed when their own range is too small.
+    for struct in dendrogram.trunk:
+        death_deltas[struct.idx] = max(leaf_deltas[struct.idx],
+                                       peaks[struct.idx] - struct.vmin)
+
+    starts = []
+    ends = []
+    values = []
+    for struct in structures:
+        struct_steps = steps[struct.idx]
+        for i, (start, value) in enumerate(struct_steps):
+            if i + 1 < len(struct_steps):
+                end = min(struct_steps[i + 1][0], death_deltas[struct.idx])
+            else:
+                end = death_deltas[struct.idx]
+            starts.append(start)
+            ends.append(end)
+            values.append(value)
+
+    death_deltas = np.array([death_deltas[struct.idx] for struct in
+                             structures])
+
+    return death_deltas, np.array(starts), np.array(ends), np.array(values)
+
+
 def hellinger_stat(x, y):
     '''
     Compute the Hellinger statistic of multiple samples.
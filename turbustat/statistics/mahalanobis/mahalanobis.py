@@ -12,22 +12,40 @@ class Mahalanobis(object):
         super(Mahalanobis, self).__init__()
         self.cube = cube
 
-    def format_data(self, data_format='spectra', *args):
+    def format_data(self, data_format='spectra', *args, **kwargs):
         '''
-        Create a 2D representation of the data. args are passed to
-        _format_data.
+        Create a 2D representation of the data. args and kwargs are passed
+        to _format_data.
         '''
 
-        self.data_matrix = _format_data(self.cube, data_format=data_format,
-                                        *args)
+        self.data_matrix = _format_data(self.cube, data_format, *args,
+                                        **kwargs)
 
         return self
 
-    def compute_distmat(self):
+    def compute_distmat(self, method='pairwise', shrinkage=None):
         '''
         Compute the Mahalanobis distance matrix.
+
+        Parameters
+        ----------
+        method : {'pairwise', 'shared'}, optional
+            'pairwise' calls `mahala_fcn` for every pair of channels.
+            'shared' uses one covariance matrix, estimated from all of the
+            channels, for every pair. See `shared_mahala_distmat`.
+        shrinkage : float, optional
+            Shrinkage of the shared covariance matrix towards a multiple of
+            the identity. Defaults to the Ledoit-Wolf estimate. Only used
+            when `method` is 'shared'.
         '''
 
+        if method == 'shared':
+            self.distance_matrix = \
+                shared_mahala_distmat(self.data_matrix, shrinkage=shrinkage)
+            return self
+        elif method != 'pairwise':
+            raise ValueError("method must be 'pairwise' or 'shared'.")
+
         channels = self.data_matrix.shape[0]
 
         self.distance_matrix = np.zeros((channels, channels))
@@ -42,12 +60,17 @@ class Mahalanobis(object):
 
         return self
 
-    def run(self, verbose=False, *args):
+    def run(self, verbose=False, *args, **kwargs):
         '''
-        Run all computations.
+        Run all computations. args and kwargs are passed to
+        `format_data`, except the `method` and `shrinkage` keywords, which
+        are passed to `compute_distmat`.
         '''
-        self.format_data(*args)
-        self.compute_distmat()
+        method = kwargs.pop('method', 'pairwise')
+        shrinkage = kwargs.pop('shrinkage', None)
+
+        self.format_data(*args, **kwargs)
+        self.compute_distmat(method=method, shrinkage=shrinkage)
 
         if verbose:
             import matplotlib.pyplot as p
@@ -69,14 +92,21 @@ class Mahalanobis_Distance(object):
         self.mahala1 = Mahalanobis(cube1)
         self.mahala2 = Mahalanobis(cube2)
 
-    def compute_distmats(self, data_format='spectra', *args):
+    def compute_distmats(self, data_format='spectra', *args, **kwargs):
         '''
-        Create a 2D representation of the data. args are passed to
-        _format_data.
+        Create a 2D representation of the data and compute the distance
+        matrices. args and kwargs are passed to _format_data, except the
+        `method` and `shrinkage` keywords, which are passed to
+        `Mahalanobis.compute_distmat`.
         '''
+        method = kwargs.pop('method', 'pairwise')
+        shrinkage = kwargs.pop('shrinkage', None)
 
-        self.mahala1.format_data(data_format=data_format, *args)
-        self.mahala2.format_data(data_format=data_format, *args)
+        self.mahala1.format_data(data_format, *args, **kwargs)
+        self.mahala2.format_data(data_format, *args, **kwargs)
+
+        self.mahala1.compute_distmat(method=method, shrinkage=shrinkage)
+        self.mahala2.compute_distmat(method=method, shrinkage=shrinkage)
 
         return self
 
@@ -107,6 +137,97 @@ class Mahalanobis_Distance(object):
         return self
 
 
+def shared_mahala_distmat(data_matrix, shrinkage=None):
+    '''
+    Mahalanobis distances between all rows of a data matrix, using one
+    covariance matrix estimated from all of the rows.
+
+    The covariance matrix S (normalized by the number of rows) is shrunk
+    towards mu I, with mu the mean variance:
+    C = (1 - shrinkage) S + shrinkage mu I. Without shrinkage, S is singular
+    whenever there are no more rows than columns, and the distances are
+    then the same for every pair.
+
+    With the SVD of the centered data matrix, X = U s V^T, the difference
+    of two rows lies in the span of V, where C has the eigenvalues
+    (1 - shrinkage) s^2 / N + shrinkage mu. Every pair is then found from
+    one SVD and a matrix product.
+
+    Parameters
+    ----------
+
+    data_matrix - numpy.ndarray
+        A 2D array. Each row is one observation.
+
+    shrinkage - float, optional
+        Shrinkage intensity between 0 and 1. Defaults to the Ledoit-Wolf
+        estimate.
+
+    '''
+
+    nobs, nvars = data_matrix.shape
+
+    centered = data_matrix - data_matrix.mean(0)
+
+    U, S, Vt = np.linalg.svd(centered, full_matrices=False)
+
+    cov_eigvals = S ** 2 / nobs
+    mu = cov_eigvals.sum() / nvars
+
+    if shrinkage is None:
+        shrinkage = _ledoit_wolf_shrinkage(centered, cov_eigvals)
+    elif not 0 <= shrinkage <= 1:
+        raise ValueError("shrinkage must be between 0 and 1.")
+
+    if shrinkage == 0:
+        rcond = S.max() * max(centered.shape) * np.finfo(float).eps
+        if (S > rcond).sum() < nvars:
+            raise ValueError("The covariance matrix is singular. Use a"
+                             " non-zero shrinkage.")
+
+    shrunk_eigvals = (1 - shrinkage) * cov_eigvals + shrinkage * mu
+
+    # Coordinates of each row in the whitened basis.
+    whitened = U * (S / np.sqrt(shrunk_eigvals))
+
+    gram = np.dot(whitened, whitened.T)
+    norms = np.diag(gram)
+
+    dist_sq = norms[:, np.newaxis] + norms[np.newaxis, :] - 2 * gram
+    # Round-off can leave small negative values.
+    dist_sq[dist_sq < 0] = 0.
+
+    distmat = np.sqrt(dist_sq)
+    np.fill_diagonal(distmat, 0.)
+
+    return distmat
+
+
+def _ledoit_wolf_shrinkage(centered, cov_eigvals):
+    '''
+    Ledoit-Wolf shrinkage intensity for the covariance matrix of the
+    centered rows, found without forming the covariance matrix.
+    '''
+
+    nobs, nvars = centered.shape
+
+    mu = cov_eigvals.sum() / nvars
+    cov_norm_sq = (cov_eigvals ** 2).sum()
+
+    # Squared distance of the covariance matrix from mu I.
+    delta = (cov_norm_sq - nvars * mu ** 2) / nvars
+
+    if delta <= 0:
+        return 0.
+
+    # Variance of the covariance estimate, from the row norms.
+    row_norms_sq = (centered ** 2).sum(1)
+    beta = ((row_norms_sq ** 2).sum() / nobs - cov_norm_sq) / \
+        (nvars * nobs)
+
+    return min(beta, delta) / delta
+
+
 def mahala_fcn(x, y):
     '''
 
@@ -1,20 +1,45 @@
 
 import numpy as np
-import numpy.random as ra
-from scipy.stats import pearsonr, spearmanr
+from scipy.stats import pearsonr, spearmanr, rankdata
 from scipy.spatial.distance import squareform
 
 
 def mantel_test(dist1, dist2, corr_func='pearson', nperm=1e3,
-                seed=2904100, pval_type='greater'):
+                seed=2904100, pval_type='greater', batch_size=100, n_jobs=1):
     '''
     Perform the Mantel test to compare 2 distance matrices.
+
+    The rows and columns of `dist1` are permuted together. The condensed
+    forms of both matrices are standardized once (after ranking for the
+    Spearman correlation), so the correlations for a batch of permutations
+    are a single matrix-vector product of the permuted entries.
+
+    Parameters
+    ----------
+    dist1 : numpy.ndarray
+        Square, symmetric distance matrix.
+    dist2 : numpy.ndarray
+        Square, symmetric distance matrix of the same shape.
+    corr_func : {'pearson', 'spearman'}, optional
+        Correlation to use.
+    nperm : int, optional
+        Number of permutations. No p-value is computed when 0.
+    seed : int, optional
+        Seed for the permutations.
+    pval_type : {'greater', 'less', 'two-tail'}, optional
+        Alternative hypothesis for the p-value.
+    batch_size : int, optional
+        Number of permutations evaluated together.
+    n_jobs : int, optional
+        Number of threads used to evaluate the batches.
     '''
 
     if corr_func is 'pearson':
         corr_func = pearsonr
+        use_ranks = False
     elif corr_func is 'spearman':
         corr_func = spearmanr
+        use_ranks = True
     else:
         raise TypeError('corr_func must be: pearson or spearman.')
 
@@ -25,19 +50,47 @@ def mantel_test(dist1, dist2, corr_func='pearson', nperm=1e3,
 
     orig_cor = corr_func(dist1_flat, dist2_flat)[0]
 
+    nperm = int(nperm)
+
     if nperm == 0:
         pval = np.NaN
         return orig_cor, pval
 
-    # Set seed
-    ra.seed(seed)
+    if use_ranks:
+        dist1_flat = rankdata(dist1_flat)
+        dist2_flat = rankdata(dist2_flat)
+
+    # Permuting the matrix only reorders the condensed entries, so their
+    # mean and norm do not change.
+    std_dist1 = squareform(_standardize_vector(dist1_flat))
+    std_dist2 = _standardize_vector(dist2_flat)
+
+    size = std_dist1.shape[0]
+    rows, cols = np.triu_indices(size, k=1)
+
+    # Draw every permutation up front with a local generator.
+    rng = np.random.RandomState(seed)
+    batches = []
+    for start in range(0, nperm, batch_size):
+        num = min(batch_size, nperm - start)
+        batches.append(np.argsort(rng.random_sample((num, size)), axis=1))
+
+    def permuted_cors(perms):
+        return np.dot(std_dist1[perms[:, rows], perms[:, cols]], std_dist2)
 
-    perm_cors = np.empty((nperm, ))
+    if n_jobs == 1:
+        perm_cors = [permuted_cors(perms) for perms in batches]
+    else:
+        from multiprocessing.pool import ThreadPool
 
-    for p in range(nperm):
-        dist1_perm = ra.permutation(dist1_flat)
+        pool = ThreadPool(n_jobs)
+        try:
+            perm_cors = pool.map(permuted_cors, batches)
+        finally:
+            pool.close()
+            pool.join()
 
-        perm_cors[p] = corr_func(dist1_perm, dist2_flat)[0]
+    perm_cors = np.concatenate(perm_cors)
 
     if pval_type == 'two-tail':
         n_higher = (np.abs(perm_cors) >= np.abs(orig_cor)).sum()
@@ -51,3 +104,14 @@ def mantel_test(dist1, dist2, corr_func='pearson', nperm=1e3,
     pval = (n_higher + 1) / float(nperm + 1)
 
     return orig_cor, pval
+
+
+def _standardize_vector(vec):
+    '''
+    Center a vector and scale it to unit norm, so the dot product of two
+    such vectors is their Pearson correlation.
+    '''
+
+    centered = vec - vec.mean()
+
+    return centered / np.sqrt((centered ** 2).sum())
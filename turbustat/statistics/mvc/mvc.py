@@ -66,13 +66,18 @@ class MVC(BaseStatisticMixIn, StatisticBase_PSpec2D):
         An unnormalized centroid can be constructed by multiplying the centroid
         array by the moment0. Velocity dispersion is the square of the
         linewidth subtracted by the square of the normalized centroid.
+
+        Both transformed fields are real, so they are packed into the real
+        and imaginary parts of one complex array and separated after a single
+        FFT using the Hermitian symmetry of real transforms.
         '''
 
-        term1 = fft2(self.centroid*self.moment0)
+        term1, mom0_fft = _two_real_fft2(self.centroid*self.moment0,
+                                         self.moment0)
 
         term2 = np.power(self.linewidth, 2) + np.power(self.centroid, 2)
 
-        mvc_fft = term1 - term2 * fft2(self.moment0)
+        mvc_fft = term1 - term2 * mom0_fft
 
         # Shift to the center
         mvc_fft = fftshift(mvc_fft)
@@ -120,6 +125,38 @@ class MVC(BaseStatisticMixIn, StatisticBase_PSpec2D):
         return self
 
 
+def _two_real_fft2(arr1, arr2):
+    '''
+    Compute the 2D FFTs of two real arrays with one complex FFT. With
+    Z = FFT(arr1 + i arr2), FFT(arr1) = (Z(k) + Z*(-k)) / 2 and
+    FFT(arr2) = (Z(k) - Z*(-k)) / 2i.
+    '''
+
+    packed_fft = fft2(arr1 + 1j * arr2)
+
+    # Z(-k) is Z flipped along each axis with the zero frequency left in
+    # place, so each quadrant of index 0 / the other indices is a view.
+    quadrants = [slice(0, 1), slice(1, None)]
+    flipped = [slice(0, 1), slice(None, 0, -1)]
+
+    # Z(k) - Z*(-k), built one quadrant at a time.
+    fft_arr2 = np.empty_like(packed_fft)
+    for out_y, in_y in zip(quadrants, flipped):
+        for out_x, in_x in zip(quadrants, flipped):
+            block = fft_arr2[out_y, out_x]
+            np.conjugate(packed_fft[in_y, in_x], out=block)
+            np.subtract(packed_fft[out_y, out_x], block, out=block)
+
+    # FFT(arr1) = Z(k) - (Z(k) - Z*(-k)) / 2 and
+    # FFT(arr2) = -i (Z(k) - Z*(-k)) / 2.
+    fft_arr2 *= 0.5
+    fft_arr1 = packed_fft
+    fft_arr1 -= fft_arr2
+    fft_arr2 *= -1j
+
+    return fft_arr1, fft_arr2
+
+
 class MVC_Distance(object):
     """
     Distance metric for MVC.
@@ -2,8 +2,11 @@
 
 
 import numpy as np
+from scipy.linalg import eigh
+from astropy.io import fits
 
-from ..threeD_to_twoD import var_cov_cube
+from ..threeD_to_twoD import (var_cov_cube, var_cov_tiles, _spatial_tiles,
+                              _read_tile, _map_tiles, _channel_sums)
 from ..base_statistic import BaseStatisticMixIn
 from ...io import common_types, threed_types, input_data
 
@@ -19,20 +22,31 @@ class PCA(BaseStatisticMixIn):
         Data cube.
     n_eigs : int
         Number of eigenvalues to compute. Defaults to using all eigenvalues.
+    out_of_core : bool, optional
+        Do not load the cube into memory. The covariance matrix is accumulated
+        from spatial tiles read from a SpectralCube or a memory-mapped array.
+        A FITS filename is opened with `memmap=True`.
     '''
 
     __doc__ %= {"dtypes": " or ".join(common_types + threed_types)}
 
-    def __init__(self, cube, n_eigs=-1):
+    def __init__(self, cube, n_eigs=-1, out_of_core=False):
         super(PCA, self).__init__()
 
         # Header not needed
         self.need_header_flag = False
         self.header = None
 
-        self.data = input_data(cube, no_header=True)
+        self.out_of_core = out_of_core
 
-        self.spectral_shape = self.data.shape[0]
+        if out_of_core:
+            self.no_data_flag = True
+            self.data = None
+            self._cube_source = _tile_source(cube)
+            self.spectral_shape = self._cube_source.shape[0]
+        else:
+            self.data = input_data(cube, no_header=True)
+            self.spectral_shape = self.data.shape[0]
 
         if n_eigs == -1:
             self.n_eigs = self.spectral_shape
@@ -43,36 +57,199 @@ class PCA(BaseStatisticMixIn):
         else:
             self.n_eigs = n_eigs
 
-    def compute_pca(self, mean_sub=False):
+    def compute_pca(self, mean_sub=False, compute_eigvecs=False,
+                    tile_size=64, n_jobs=1, method='eigh', oversample=10,
+                    n_power_iter=2, random_seed=None):
         '''
         Create the covariance matrix and its eigenvalues.
 
         If `mean_sub` is disabled, the first eigenvalue is dominated by the
         mean of the data, not the variance.
 
+        The covariance matrix is symmetric, so only the largest `n_eigs`
+        eigenvalues are found with `~scipy.linalg.eigh`. The total variance
+        is the trace of the covariance matrix.
+
+        With `method='randomized'`, the covariance matrix is never formed.
+        The top eigenvalues are estimated from a randomized range finder
+        applied to the data in spatial tiles (Halko et al., 2011). The
+        residual norm of each estimated eigenpair, an upper bound on the
+        distance to the nearest true eigenvalue, is kept in `eigval_errs`.
+        NaNs are zero-filled and each channel is normalized by its own
+        number of finite pixels, so the covariance of two channels is divided
+        by the geometric mean of their counts rather than the number of
+        pixels where both are finite. These are the same without NaNs.
+
         Parameters
         ----------
         mean_sub : bool, optional
             When enabled, subtracts the means of the channels before
             calculating the covariance. By default, this is disabled to
             match the Heyer & Brunt method.
+        compute_eigvecs : bool, optional
+            Also compute the eigenvectors for the kept eigenvalues. These are
+            stored as the columns of `eigvecs`.
+        tile_size : int, optional
+            Size of the spatial tiles used when `out_of_core` is enabled.
+        n_jobs : int, optional
+            Number of threads used to reduce the tiles when `out_of_core` is
+            enabled, or with the randomized method.
+        method : {'eigh', 'randomized'}, optional
+            Solve the full covariance matrix, or estimate the eigenvalues with
+            a randomized sketch of the data.
+        oversample : int, optional
+            Number of extra sketch vectors used by the randomized method.
+        n_power_iter : int, optional
+            Number of power iterations used by the randomized method. More
+            iterations improve accuracy when the eigenvalues decay slowly.
+        random_seed : int, optional
+            Seed for the randomized method.
         '''
 
-        self.cov_matrix = var_cov_cube(self.data, mean_sub=mean_sub)
+        if method == 'randomized':
+            if self.out_of_core:
+                cube = self._cube_source
+            else:
+                cube = self.data
+
+            eigvals, eigvecs, self.eigval_errs, trace = \
+                _randomized_cov_eigs(cube, self.n_eigs, mean_sub=mean_sub,
+                                     oversample=oversample,
+                                     n_power_iter=n_power_iter,
+                                     random_seed=random_seed,
+                                     tile_size=tile_size, n_jobs=n_jobs)
+            self.eigval_errs = self.eigval_errs[:self.n_eigs]
+
+            self.cov_matrix = None
+            self.eigvecs = eigvecs if compute_eigvecs else None
+
+        elif method == 'eigh':
+            if self.out_of_core:
+                self.cov_matrix = var_cov_tiles(self._cube_source,
+                                                mean_sub=mean_sub,
+                                                tile_size=tile_size,
+                                                n_jobs=n_jobs)
+            else:
+                self.cov_matrix = var_cov_cube(self.data, mean_sub=mean_sub)
+
+            eig_range = (self.spectral_shape - self.n_eigs,
+                         self.spectral_shape - 1)
+
+            if compute_eigvecs:
+                eigvals, eigvecs = eigh(self.cov_matrix, eigvals=eig_range)
+                # Sort by maximum
+                self.eigvecs = eigvecs[:, ::-1]
+            else:
+                eigvals = eigh(self.cov_matrix, eigvals=eig_range,
+                               eigvals_only=True)
+                self.eigvecs = None
+
+            eigvals = eigvals[::-1]  # Sort by maximum
+
+            trace = np.trace(self.cov_matrix)
+
+            self.eigval_errs = None
 
-        all_eigsvals, eigvecs = np.linalg.eig(self.cov_matrix)
-        all_eigsvals = np.sort(all_eigsvals)[::-1]  # Sort by maximum
+        else:
+            raise ValueError("method must be 'eigh' or 'randomized'.")
 
         if mean_sub:
-            self._total_variance = np.sum(all_eigsvals)
-            self._var_prop = np.sum(all_eigsvals[:self.n_eigs]) / \
+            self._total_variance = trace
+            self._var_prop = np.sum(eigvals[:self.n_eigs]) / \
                 self.total_variance
         else:
-            self._total_variance = np.sum(all_eigsvals[1:])
-            self._var_prop = np.sum(all_eigsvals[1:self.n_eigs]) / \
+            self._total_variance = trace - eigvals[0]
+            self._var_prop = np.sum(eigvals[1:self.n_eigs]) / \
                 self.total_variance
 
-        self.eigvals = all_eigsvals[:self.n_eigs]
+        self.eigvals = eigvals[:self.n_eigs]
+
+        if self.eigvecs is not None:
+            self.eigvecs = self.eigvecs[:, :self.n_eigs]
+
+        self._mean_sub = mean_sub
+
+    def compute_eigenimages(self, n_eigs=None, tile_size=64, n_jobs=1,
+                            memmap_file=None):
+        '''
+        Project the cube onto the leading eigenvectors to create the
+        eigenimages (Heyer & Brunt, 1997). The cube is projected one spatial
+        tile at a time, so no second copy of the cube is made. The
+        eigenspectra are the eigenvectors. The eigenvectors must have been
+        computed with `compute_eigvecs=True`.
+
+        NaNs are treated as zero in the projection. Pixels with no finite
+        channels are NaN in the eigenimages. When the covariance matrix was
+        computed with `mean_sub`, the channel means are subtracted first.
+
+        Parameters
+        ----------
+        n_eigs : int, optional
+            Number of eigenimages to compute. Defaults to all of the kept
+            eigenvectors.
+        tile_size : int, optional
+            Size of the spatial tiles.
+        n_jobs : int, optional
+            Number of threads used to project the tiles.
+        memmap_file : str, optional
+            Write the eigenimages to a `~numpy.memmap` with this filename
+            rather than holding them in memory.
+        '''
+
+        if getattr(self, "eigvecs", None) is None:
+            raise ValueError("The eigenvectors must be computed first. Run "
+                             "compute_pca with compute_eigvecs=True.")
+
+        if n_eigs is None:
+            n_eigs = self.eigvecs.shape[1]
+        elif n_eigs < 1 or n_eigs > self.eigvecs.shape[1]:
+            raise ValueError("n_eigs must be between 1 and the number of "
+                             "computed eigenvectors "
+                             "({}).".format(self.eigvecs.shape[1]))
+
+        if self.out_of_core:
+            cube = self._cube_source
+        else:
+            cube = self.data
+
+        spatial_shape = cube.shape[1:]
+        tiles = list(_spatial_tiles(spatial_shape, tile_size))
+
+        if self._mean_sub:
+            sums, counts = _channel_sums(cube, tiles, n_jobs=n_jobs)
+            chan_means = sums / counts
+        else:
+            chan_means = np.zeros(self.spectral_shape)
+
+        eigvecs = self.eigvecs[:, :n_eigs]
+
+        if memmap_file is not None:
+            eigenimages = np.memmap(memmap_file, dtype=np.float64, mode='w+',
+                                    shape=(n_eigs,) + spatial_shape)
+        else:
+            eigenimages = np.empty((n_eigs,) + spatial_shape)
+
+        def tile_project(tile):
+            flat_tile = _read_tile(cube, *tile)
+            finite = np.isfinite(flat_tile)
+            flat_tile = np.where(finite,
+                                 flat_tile - chan_means[:, np.newaxis], 0.0)
+
+            proj = np.dot(eigvecs.T, flat_tile)
+            proj[:, ~finite.any(axis=0)] = np.NaN
+
+            yslice, xslice = tile
+            tile_shape = eigenimages[:, yslice, xslice].shape
+            eigenimages[:, yslice, xslice] = proj.reshape(tile_shape)
+
+        for _ in _map_tiles(tile_project, tiles, n_jobs):
+            pass
+
+        if memmap_file is not None:
+            eigenimages.flush()
+
+        self.eigenimages = eigenimages
+        self.eigenspectra = eigvecs.T
 
     @property
     def var_proportion(self):
@@ -82,7 +259,9 @@ class PCA(BaseStatisticMixIn):
     def total_variance(self):
         return self._total_variance
 
-    def run(self, verbose=False, mean_sub=False):
+    def run(self, verbose=False, mean_sub=False, compute_eigvecs=False,
+            tile_size=64, n_jobs=1, method='eigh', oversample=10,
+            n_power_iter=2, random_seed=None):
         '''
         Run method. Needed to maintain package standards.
 
@@ -90,19 +269,41 @@ class PCA(BaseStatisticMixIn):
         ----------
         verbose : bool, optional
             Enables plotting.
+        mean_sub : bool, optional
+            See `~PCA.compute_pca`.
+        compute_eigvecs : bool, optional
+            See `~PCA.compute_pca`.
+        tile_size : int, optional
+            See `~PCA.compute_pca`.
+        n_jobs : int, optional
+            See `~PCA.compute_pca`.
+        method : {'eigh', 'randomized'}, optional
+            See `~PCA.compute_pca`.
+        oversample : int, optional
+            See `~PCA.compute_pca`.
+        n_power_iter : int, optional
+            See `~PCA.compute_pca`.
+        random_seed : int, optional
+            See `~PCA.compute_pca`.
         '''
 
-        self.compute_pca(mean_sub=mean_sub)
+        self.compute_pca(mean_sub=mean_sub, compute_eigvecs=compute_eigvecs,
+                         tile_size=tile_size, n_jobs=n_jobs, method=method,
+                         oversample=oversample, n_power_iter=n_power_iter,
+                         random_seed=random_seed)
 
         if verbose:
             import matplotlib.pyplot as p
 
             print 'Proportion of Variance kept: %s' % (self.var_proportion)
 
-            p.subplot(121)
-            p.imshow(self.cov_matrix, origin="lower", interpolation="nearest")
-            p.colorbar()
-            p.subplot(122)
+            # The randomized method does not form the covariance matrix
+            if self.cov_matrix is not None:
+                p.subplot(121)
+                p.imshow(self.cov_matrix, origin="lower",
+                         interpolation="nearest")
+                p.colorbar()
+                p.subplot(122)
             p.bar(np.arange(1, self.n_eigs + 1), self.eigvals, 0.5, color='r')
             p.xlim([0, self.n_eigs + 1])
             p.xlabel('Eigenvalues')
@@ -131,22 +332,37 @@ class PCA_Distance(object):
     mean_sub : bool, optional
         Subtracts the mean before computing the covariance matrix. Not
         subtracting the mean is done in the original Heyer & Brunt works.
+    out_of_core : bool, optional
+        Accumulate the covariance matrices from spatial tiles without loading
+        the cubes. See `~PCA`.
+    tile_size : int, optional
+        Size of the spatial tiles used when `out_of_core` is enabled.
+    n_jobs : int, optional
+        Number of threads used to reduce the tiles.
+    method : {'eigh', 'randomized'}, optional
+        Method used to find the eigenvalues. See `~PCA.compute_pca`.
+    random_seed : int, optional
+        Seed for the randomized method.
     '''
 
     __doc__ %= {"dtypes": " or ".join(common_types + threed_types)}
 
     def __init__(self, cube1, cube2, n_eigs=50, fiducial_model=None,
-                 mean_sub=True):
+                 mean_sub=True, out_of_core=False, tile_size=64, n_jobs=1,
+                 method='eigh', random_seed=None):
         super(PCA_Distance, self).__init__()
 
         if fiducial_model is not None:
             self.pca1 = fiducial_model
         else:
-            self.pca1 = PCA(cube1, n_eigs=n_eigs)
-            self.pca1.run(mean_sub=mean_sub)
+            self.pca1 = PCA(cube1, n_eigs=n_eigs, out_of_core=out_of_core)
+            self.pca1.run(mean_sub=mean_sub, tile_size=tile_size,
+                          n_jobs=n_jobs, method=method,
+                          random_seed=random_seed)
 
-        self.pca2 = PCA(cube2, n_eigs=n_eigs)
-        self.pca2.run(mean_sub=mean_sub)
+        self.pca2 = PCA(cube2, n_eigs=n_eigs, out_of_core=out_of_core)
+        self.pca2.run(mean_sub=mean_sub, tile_size=tile_size, n_jobs=n_jobs,
+                      method=method, random_seed=random_seed)
 
         self._mean_sub = mean_sub
 
@@ -209,3 +425,95 @@ class PCA_Distance(object):
             p.show()
 
         return self
+
+
+def _tile_source(cube):
+    '''
+    Return an object that spatial tiles can be read from without loading the
+    whole cube.
+    '''
+
+    if isinstance(cube, str):
+        return fits.open(cube, memmap=True)[0].data
+    elif isinstance(cube, fits.PrimaryHDU):
+        return cube.data
+    elif isinstance(cube, tuple) or isinstance(cube, list):
+        return cube[0]
+    elif isinstance(cube, np.ndarray) or hasattr(cube, "filled_data"):
+        return cube
+
+    raise TypeError("cube must be a FITS filename, a PrimaryHDU, a "
+                    "SpectralCube or an array for out-of-core PCA.")
+
+
+def _randomized_cov_eigs(cube, n_eigs, mean_sub=False, oversample=10,
+                         n_power_iter=2, random_seed=None, tile_size=64,
+                         n_jobs=1):
+    '''
+    Estimate the largest eigenvalues of the channel covariance matrix with a
+    randomized range finder. The covariance matrix is only applied to blocks
+    of vectors, one spatial tile at a time.
+
+    Returns
+    -------
+    eigvals : numpy.ndarray
+        Estimated eigenvalues, largest first.
+    eigvecs : numpy.ndarray
+        Estimated eigenvectors as columns.
+    eigval_errs : numpy.ndarray
+        Residual norms of the eigenpairs.
+    trace : float
+        Trace of the covariance matrix.
+    '''
+
+    n_chan = cube.shape[0]
+    n_sketch = min(n_eigs + oversample, n_chan)
+
+    tiles = list(_spatial_tiles(cube.shape[1:], tile_size))
+
+    sums, counts = _channel_sums(cube, tiles, n_jobs=n_jobs)
+    chan_means = sums / counts if mean_sub else np.zeros(n_chan)
+
+    # Apply Bessel's correction when mean subtracting
+    chan_norm = 1 / np.sqrt(counts - 1.0 if mean_sub else counts)
+
+    def apply_cov(vecs):
+        def tile_apply(tile):
+            flat_tile = _read_tile(cube, *tile)
+            flat_tile = np.where(np.isfinite(flat_tile),
+                                 flat_tile - chan_means[:, np.newaxis], 0.0)
+            flat_tile *= chan_norm[:, np.newaxis]
+            return (np.dot(flat_tile, np.dot(flat_tile.T, vecs)),
+                    (flat_tile**2).sum(axis=1))
+
+        cov_vecs = np.zeros_like(vecs)
+        diag = np.zeros(n_chan)
+        for tile_vecs, tile_diag in _map_tiles(tile_apply, tiles, n_jobs):
+            cov_vecs += tile_vecs
+            diag += tile_diag
+
+        return cov_vecs, diag
+
+    rng = np.random.RandomState(random_seed)
+
+    sketch, diag = apply_cov(rng.standard_normal((n_chan, n_sketch)))
+    for _ in range(n_power_iter):
+        basis = np.linalg.qr(sketch)[0]
+        sketch = apply_cov(basis)[0]
+
+    basis = np.linalg.qr(sketch)[0]
+    cov_basis = apply_cov(basis)[0]
+
+    # Rayleigh-Ritz on the sketched subspace
+    proj_cov = np.dot(basis.T, cov_basis)
+    proj_cov = 0.5 * (proj_cov + proj_cov.T)
+
+    eigvals, proj_vecs = eigh(proj_cov)
+    eigvals = eigvals[::-1][:n_eigs]
+    proj_vecs = proj_vecs[:, ::-1][:, :n_eigs]
+
+    eigvecs = np.dot(basis, proj_vecs)
+    residuals = np.dot(cov_basis, proj_vecs) - eigvecs * eigvals
+    eigval_errs = np.sqrt((residuals**2).sum(axis=0))
+
+    return eigvals, eigvecs, eigval_errs, diag.sum()
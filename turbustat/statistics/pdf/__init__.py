@@ -1 +1,2 @@
-from compare_pdf import PDF, PDF_Distance
\ No newline at end of file
+from compare_pdf import PDF, PDF_Distance
+from quantile_sketch import QuantileSketch, sketch_ks_2samp
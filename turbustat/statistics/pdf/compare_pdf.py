@@ -1,10 +1,12 @@
 # Licensed under an MIT open source license - see LICENSE
 
 import numpy as np
-from scipy.stats import ks_2samp, anderson_ksamp
-from statsmodels.distributions.empirical_distribution import ECDF
+from scipy.stats import anderson_ksamp
+
+from astropy.io import fits
 
 from ..stats_utils import hellinger, standardize, common_histogram_bins
+from .quantile_sketch import QuantileSketch, sketch_ks_2samp, _ks_2samp_pval
 from ..base_statistic import BaseStatisticMixIn
 from ...io import common_types, twod_types, threed_types, input_data
 
@@ -25,18 +27,55 @@ class PDF(BaseStatisticMixIn):
         Weights to apply to the image. Must have the same shape as the image.
     use_standardized : bool, optional
         Enable to standardize the data before computing the PDF and ECDF.
+    out_of_core : bool, optional
+        Never load the whole image. `img` and `weights` may also be FITS
+        filenames, which are memory-mapped. A first pass over chunks finds
+        the number of values, their range, mean and standard deviation, and
+        the histogram is accumulated in a second pass. The ECDF, percentiles
+        and KS test then use a quantile sketch. `data` is not set.
+    chunk_size : int, optional
+        Approximate number of values read at a time when `out_of_core` is
+        enabled. Chunks are taken along the first axis.
     '''
 
     __doc__ %= {"dtypes": " or ".join(common_types + twod_types +
                                       threed_types)}
 
     def __init__(self, img, min_val=0.0, bins=None, weights=None,
-                 use_standardized=False):
+                 use_standardized=False, out_of_core=False,
+                 chunk_size=2**20):
         super(PDF, self).__init__()
 
         self.need_header_flag = False
         self.header = None
 
+        self._bins = bins
+
+        self._pdf = None
+        self._ecdf = None
+        self._sketch = None
+        self._sorted_data = None
+
+        self._out_of_core = out_of_core
+        self._standardize_flag = use_standardized
+
+        if out_of_core:
+            self.no_data_flag = True
+            self.img = None
+            self.data = None
+
+            self._min_val = min_val
+            self._chunk_size = chunk_size
+            self._img_source = _chunk_source(img)
+            if weights is not None:
+                self._weight_source = _chunk_source(weights)
+            else:
+                self._weight_source = None
+
+            self._data_stats = _chunked_stats(self._raw_chunks())
+
+            return
+
         output_data = input_data(img, no_header=True)
 
         self.img = output_data
@@ -56,15 +95,70 @@ class PDF(BaseStatisticMixIn):
 
             self.data = self.data[isfinite] * self.weights[isfinite]
 
-        self._standardize_flag = False
         if use_standardized:
-            self._standardize_flag = True
             self.data = standardize(self.data)
 
-        self._bins = bins
+    def _raw_chunks(self):
+        '''
+        Kept and weighted values, one chunk at a time, from the out-of-core
+        sources.
+        '''
 
-        self._pdf = None
-        self._ecdf = None
+        for chunk_slice in _chunk_slices(self._img_source.shape,
+                                         self._chunk_size):
+            values = _read_chunk(self._img_source, chunk_slice)
+
+            keep_values = np.logical_and(np.isfinite(values),
+                                         values > self._min_val)
+            values = values[keep_values]
+
+            if self._weight_source is not None:
+                weights = _read_chunk(self._weight_source,
+                                      chunk_slice)[keep_values]
+                isfinite = np.isfinite(weights)
+                values = values[isfinite] * weights[isfinite]
+
+            yield values
+
+    def _iter_chunks(self, chunk_size):
+        '''
+        The data, standardized if enabled, one chunk at a time.
+        '''
+
+        if not self._out_of_core:
+            for start in range(0, self.data.size, chunk_size):
+                yield self.data[start:start + chunk_size]
+            return
+
+        for values in self._raw_chunks():
+            if self._standardize_flag:
+                values = (values - self._data_stats["mean"]) / \
+                    self._data_stats["std"]
+            yield values
+
+    @property
+    def n_values(self):
+        '''
+        Number of values in the data.
+        '''
+        if self._out_of_core:
+            return self._data_stats["n"]
+        return self.data.size
+
+    @property
+    def data_range(self):
+        '''
+        Minimum and maximum of the data, standardized if enabled.
+        '''
+        if self._out_of_core:
+            data_range = np.array([self._data_stats["min"],
+                                   self._data_stats["max"]])
+            if self._standardize_flag:
+                data_range = (data_range - self._data_stats["mean"]) / \
+                    self._data_stats["std"]
+            return data_range
+
+        return np.array([np.nanmin(self.data), np.nanmax(self.data)])
 
     def make_pdf(self, bins=None):
         '''
@@ -81,9 +175,25 @@ class PDF(BaseStatisticMixIn):
 
         # If the number of bins is not given, use sqrt of data length.
         if self.bins is None:
-            self._bins = np.sqrt(self.data.shape[0])
+            self._bins = np.sqrt(self.n_values)
             self._bins = int(np.round(self.bins))
 
+        if self._out_of_core:
+            if np.isscalar(self.bins):
+                data_range = self.data_range
+                bin_edges = np.linspace(data_range[0], data_range[1],
+                                        self.bins + 1)
+            else:
+                bin_edges = np.asarray(self.bins)
+
+            counts = np.zeros(bin_edges.size - 1)
+            for values in self._iter_chunks(self._chunk_size):
+                counts += np.histogram(values, bins=bin_edges)[0]
+
+            self._pdf = counts / float(self.n_values)
+            self._bins = (bin_edges[:-1] + bin_edges[1:]) / 2
+            return
+
         norm_weights = np.ones_like(self.data) / self.data.shape[0]
 
         self._pdf, bin_edges = np.histogram(self.data, bins=self.bins,
@@ -104,18 +214,77 @@ class PDF(BaseStatisticMixIn):
     def bins(self):
         return self._bins
 
-    def make_ecdf(self):
+    @property
+    def sorted_data(self):
+        '''
+        The data sorted in ascending order. Sorted once and kept, so the
+        ECDF and repeated KS tests against this PDF do not sort again.
+        '''
+        if self._out_of_core:
+            raise ValueError("The data are not kept when out_of_core is "
+                             "enabled. Use the quantile sketch instead.")
+
+        if self._sorted_data is None:
+            self._sorted_data = np.sort(self.data)
+
+        return self._sorted_data
+
+    def make_sketch(self, k=4096, chunk_size=2**20, random_seed=None):
+        '''
+        Build a quantile sketch of the data in one pass over chunks. See
+        `~turbustat.statistics.pdf.QuantileSketch`.
+
+        Parameters
+        ----------
+        k : int, optional
+            Capacity of each level in the sketch. The rank error is at most
+            (floor(log2(n / k)) + 1) / k for n values.
+        chunk_size : int, optional
+            Number of values added to the sketch at a time.
+        random_seed : int, optional
+            Seed for the sketch compactions.
+        '''
+
+        self._sketch = QuantileSketch(k=k, random_seed=random_seed)
+
+        for values in self._iter_chunks(chunk_size):
+            self._sketch.update(values)
+
+    @property
+    def sketch(self):
+        return self._sketch
+
+    def make_ecdf(self, use_sketch=False):
         '''
         Create the ECDF.
+
+        Parameters
+        ----------
+        use_sketch : bool, optional
+            Use the approximate ECDF from the quantile sketch instead of
+            sorting all of the data. The sketch is created if needed. Always
+            used when `out_of_core` is enabled.
         '''
 
         if self.pdf is None:
             self.make_pdf()
 
-        self._ecdf_function = ECDF(self.data)
+        if use_sketch or self._out_of_core:
+            if self.sketch is None:
+                self.make_sketch()
+            self._ecdf_function = self.sketch.cdf
+        else:
+            self._ecdf_function = self._sorted_ecdf
 
         self._ecdf = self._ecdf_function(self.bins)
 
+    def _sorted_ecdf(self, values):
+        '''
+        ECDF from the sorted data.
+        '''
+        return np.searchsorted(self.sorted_data, values, side='right') / \
+            float(self.n_values)
+
     @property
     def ecdf(self):
         return self._ecdf
@@ -136,7 +305,7 @@ class PDF(BaseStatisticMixIn):
 
         return self._ecdf_function(values) * 100.
 
-    def find_at_percentile(self, percentiles):
+    def find_at_percentile(self, percentiles, use_sketch=False):
         '''
         Return the values at the given percentiles.
 
@@ -144,14 +313,21 @@ class PDF(BaseStatisticMixIn):
         ----------
         percentiles : float or np.ndarray
             Percentile or array of percentiles. Must be between 0 and 100.
+        use_sketch : bool, optional
+            Return approximate values from the quantile sketch.
         '''
 
         if np.any(np.logical_or(percentiles > 100, percentiles < 0.)):
             raise ValueError("Percentiles must be between 0 and 100.")
 
+        if use_sketch or self._out_of_core:
+            if self.sketch is None:
+                self.make_sketch()
+            return self.sketch.quantile(np.asarray(percentiles) / 100.)
+
         return np.percentile(self.data, percentiles)
 
-    def run(self, verbose=False, bins=None):
+    def run(self, verbose=False, bins=None, use_sketch=False):
         '''
         Compute the PDF and ECDF. Enabling verbose provides
         a summary plot.
@@ -162,10 +338,12 @@ class PDF(BaseStatisticMixIn):
             Enables plotting of the results.
         bins : list or numpy.ndarray or int, optional
             Bins to compute the PDF from. Overrides initial bin input.
+        use_sketch : bool, optional
+            Compute the ECDF from a quantile sketch.
         '''
 
         self.make_pdf(bins=bins)
-        self.make_ecdf()
+        self.make_ecdf(use_sketch=use_sketch)
 
         if verbose:
 
@@ -222,24 +400,45 @@ class PDF_Distance(object):
         Weights to be used with img1
     weights2 : %(dtypes)s, optional
         Weights to be used with img2
+    out_of_core : bool, optional
+        Compute the PDFs in chunks. See `~PDF`. The KS distance is then
+        computed from quantile sketches.
+    chunk_size : int, optional
+        Number of values read at a time when `out_of_core` is enabled.
+    fiducial_model : PDF
+        Computed, standardized PDF object for img1. Use to avoid
+        recomputing. Its sorted data is kept between comparisons.
     '''
 
     __doc__ %= {"dtypes": " or ".join(common_types + twod_types +
                                       threed_types)}
 
     def __init__(self, img1, img2, min_val1=0.0, min_val2=0.0,
-                 weights1=None, weights2=None):
+                 weights1=None, weights2=None, out_of_core=False,
+                 chunk_size=2**20, fiducial_model=None):
         super(PDF_Distance, self).__init__()
 
-        self.PDF1 = PDF(img1, min_val=min_val1, use_standardized=True,
-                        weights=weights1)
+        if fiducial_model is not None:
+            if not fiducial_model.is_standardized:
+                raise ValueError("fiducial_model must be created with "
+                                 "use_standardized=True.")
+            self.PDF1 = fiducial_model
+        else:
+            self.PDF1 = PDF(img1, min_val=min_val1, use_standardized=True,
+                            weights=weights1, out_of_core=out_of_core,
+                            chunk_size=chunk_size)
 
         self.PDF2 = PDF(img2, min_val=min_val2, use_standardized=True,
-                        weights=weights2)
+                        weights=weights2, out_of_core=out_of_core,
+                        chunk_size=chunk_size)
 
+        # The bins only need the ranges and the number of values, so this
+        # also works with the pass statistics of out-of-core PDFs.
+        nbins = np.floor(np.sqrt((self.PDF1.n_values +
+                                  self.PDF2.n_values) / 2.)).astype(int)
         self.bins, self.bin_centers = \
-            common_histogram_bins(self.PDF1.data, self.PDF2.data,
-                                  return_centered=True)
+            common_histogram_bins(self.PDF1.data_range, self.PDF2.data_range,
+                                  nbins=nbins, return_centered=True)
 
         # Feed the common set of bins to be used in the PDFs
         self.PDF1.run(verbose=False, bins=self.bins)
@@ -252,12 +451,28 @@ class PDF_Distance(object):
 
         self.hellinger_distance = hellinger(self.PDF1.pdf, self.PDF2.pdf)
 
-    def compute_ks_distance(self):
+    def compute_ks_distance(self, use_sketch=False):
         '''
         Compute the distance using the KS Test.
+
+        Parameters
+        ----------
+        use_sketch : bool, optional
+            Compute an approximate KS statistic from quantile sketches of
+            the two PDFs. The bound on its error is set in
+            `ks_distance_error`.
         '''
 
-        D, p = ks_2samp(self.PDF1.data, self.PDF2.data)
+        if use_sketch or self.PDF1.data is None or self.PDF2.data is None:
+            for pdf in (self.PDF1, self.PDF2):
+                if pdf.sketch is None:
+                    pdf.make_sketch()
+
+            D, p, self.ks_distance_error = \
+                sketch_ks_2samp(self.PDF1.sketch, self.PDF2.sketch)
+        else:
+            D, p = _ks_2samp_sorted(self.PDF1.sorted_data,
+                                    self.PDF2.sorted_data)
 
         self.ks_distance = D
         self.ks_pval = p
@@ -278,7 +493,7 @@ class PDF_Distance(object):
 
     def distance_metric(self, statistic='all', verbose=False,
                         label1=None, label2=None,
-                        show_data=True):
+                        show_data=True, use_sketch=False):
         '''
         Calculate the distance.
         *NOTE:* The data are standardized before comparing to ensure the
@@ -298,16 +513,18 @@ class PDF_Distance(object):
             Object or region name for img2
         show_data : bool, optional
             Plot the moment0, image, or 1D data.
+        use_sketch : bool, optional
+            Compute the KS distance from quantile sketches.
         '''
 
         if statistic is 'all':
             self.compute_hellinger_distance()
-            self.compute_ks_distance()
+            self.compute_ks_distance(use_sketch=use_sketch)
             # self.compute_ad_distance()
         elif statistic is 'hellinger':
             self.compute_hellinger_distance()
         elif statistic is 'ks':
-            self.compute_ks_distance()
+            self.compute_ks_distance(use_sketch=use_sketch)
         # elif statistic is 'ad':
         #     self.compute_ad_distance()
         else:
@@ -341,3 +558,102 @@ class PDF_Distance(object):
             p.show()
 
         return self
+
+
+def _ks_2samp_sorted(data1, data2):
+    '''
+    Two-sample KS test for samples that are already sorted, without sorting
+    either sample. The statistic is exact. The p-value is the asymptotic
+    two-sample KS p-value (`scipy.stats.ks_2samp` with `mode='asymp'`),
+    not the exact one that newer versions of scipy use by default.
+    '''
+
+    n1 = data1.shape[0]
+    n2 = data2.shape[0]
+
+    data_all = np.concatenate([data1, data2])
+    cdf1 = np.searchsorted(data1, data_all, side='right') / float(n1)
+    cdf2 = np.searchsorted(data2, data_all, side='right') / float(n2)
+
+    D = np.max(np.absolute(cdf1 - cdf2))
+
+    return D, _ks_2samp_pval(D, n1, n2)
+
+
+def _chunk_source(data):
+    '''
+    Return an object that chunks can be read from without loading all of
+    the data.
+    '''
+
+    if isinstance(data, str):
+        return fits.open(data, memmap=True)[0].data
+    elif isinstance(data, fits.PrimaryHDU):
+        return data.data
+    elif isinstance(data, tuple) or isinstance(data, list):
+        return data[0]
+    elif isinstance(data, np.ndarray) or hasattr(data, "filled_data"):
+        return data
+
+    raise TypeError("data must be a FITS filename, a PrimaryHDU, a "
+                    "SpectralCube or an array for out-of-core PDFs.")
+
+
+def _chunk_slices(shape, chunk_size):
+    '''
+    Slices along the first axis holding about `chunk_size` values each.
+    '''
+
+    plane_size = int(np.prod(shape[1:]))
+    planes = max(1, chunk_size // max(plane_size, 1))
+
+    for start in range(0, shape[0], planes):
+        yield slice(start, start + planes)
+
+
+def _read_chunk(data, chunk_slice):
+    '''
+    Read a chunk from an array or SpectralCube.
+    '''
+
+    if hasattr(data, "filled_data"):
+        return data.filled_data[chunk_slice].value
+
+    return np.asarray(data[chunk_slice], dtype=np.float64)
+
+
+def _chunked_stats(chunks):
+    '''
+    Number of values, minimum, maximum, mean and (population) standard
+    deviation from chunks of values. Chunk means and sums of squared
+    deviations are combined pairwise (Chan et al., 1979).
+    '''
+
+    n = 0
+    mean = 0.
+    sum_sq = 0.
+    min_val = np.inf
+    max_val = -np.inf
+
+    for values in chunks:
+        if values.size == 0:
+            continue
+
+        chunk_n = values.size
+        chunk_mean = values.mean()
+        chunk_sum_sq = ((values - chunk_mean) ** 2).sum()
+
+        delta = chunk_mean - mean
+        total = n + chunk_n
+        mean += delta * chunk_n / float(total)
+        sum_sq += chunk_sum_sq + delta ** 2 * n * chunk_n / float(total)
+        n = total
+
+        min_val = min(min_val, values.min())
+        max_val = max(max_val, values.max())
+
+    if n == 0:
+        raise ValueError("No values are kept in the data.")
+
+    return {"n": n, "min": min_val, "max": max_val, "mean": mean,
+            "std": np.sqrt(sum_sq / n)}
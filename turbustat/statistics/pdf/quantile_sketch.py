@@ -0,0 +1,248 @@
+# Licensed under an MIT open source license - see LICENSE
+
+import numpy as np
+from scipy.stats import distributions
+
+
+class QuantileSketch(object):
+    '''
+    Mergeable quantile sketch built from a stack of compactors, each with
+    the same capacity `k`.
+
+    Values are added to the lowest level. When a level holds more than `k`
+    values, it is sorted and every second value (with a random offset) is
+    promoted to the next level, where it carries twice the weight. Each
+    compaction at level h shifts the rank of any value by at most 2^h, and
+    the sum over all compactions is kept as a deterministic bound on the
+    rank error.
+
+    A compaction at level h removes at least k values of weight 2^h, so
+    level h contributes at most n / k to the bound, and only the levels
+    h <= log2(n / k) compact. The bound on the normalized rank error is
+    then at most (floor(log2(n / k)) + 1) / k. This also holds for merged
+    sketches, with n the total number of values.
+
+    Parameters
+    ----------
+    k : int, optional
+        Capacity of each level.
+    random_seed : int, optional
+        Seed for the compaction offsets.
+    '''
+
+    def __init__(self, k=4096, random_seed=None):
+        super(QuantileSketch, self).__init__()
+
+        if k < 2:
+            raise ValueError("k must be at least 2.")
+
+        self.k = int(k)
+        self.n = 0
+
+        self._levels = [np.empty(0)]
+        self._rank_error = 0
+        self._rng = np.random.RandomState(random_seed)
+
+        self._sorted_items = None
+        self._cum_weights = None
+
+    def update(self, values):
+        '''
+        Add values to the sketch. NaNs and infs are ignored.
+
+        Parameters
+        ----------
+        values : numpy.ndarray
+            Values to add.
+        '''
+
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[np.isfinite(values)]
+
+        if values.size == 0:
+            return
+
+        self._levels[0] = np.append(self._levels[0], values)
+        self.n += values.size
+
+        self._compress()
+
+    def merge(self, other):
+        '''
+        Merge another sketch into this one. The rank error bounds add.
+
+        Parameters
+        ----------
+        other : QuantileSketch
+            Sketch built with the same `k`.
+        '''
+
+        if other.k != self.k:
+            raise ValueError("Sketches must have the same k to be merged.")
+
+        for h, level in enumerate(other._levels):
+            if h == len(self._levels):
+                self._levels.append(np.empty(0))
+            self._levels[h] = np.append(self._levels[h], level)
+
+        self.n += other.n
+        self._rank_error += other._rank_error
+
+        self._compress()
+
+        return self
+
+    def _compress(self):
+        '''
+        Compact every level that is over capacity.
+        '''
+
+        h = 0
+        while h < len(self._levels):
+            level = self._levels[h]
+
+            if level.size > self.k:
+                level = np.sort(level)
+
+                # Compact an even number of values so the total weight is
+                # unchanged. An odd value out stays on this level.
+                even_size = level.size - level.size % 2
+                offset = self._rng.randint(2)
+
+                if h + 1 == len(self._levels):
+                    self._levels.append(np.empty(0))
+
+                self._levels[h + 1] = \
+                    np.append(self._levels[h + 1],
+                              level[offset:even_size:2])
+                self._levels[h] = level[even_size:]
+
+                self._rank_error += 2 ** h
+
+            h += 1
+
+        self._sorted_items = None
+        self._cum_weights = None
+
+    def _weighted_items(self):
+        '''
+        Sorted values in the sketch and their cumulative weights.
+        '''
+
+        if self._sorted_items is None:
+            items = np.concatenate(self._levels)
+            weights = np.concatenate([np.ones(level.size) * 2 ** h for h,
+                                      level in enumerate(self._levels)])
+
+            order = np.argsort(items, kind='mergesort')
+            self._sorted_items = items[order]
+            self._cum_weights = np.cumsum(weights[order])
+
+        return self._sorted_items, self._cum_weights
+
+    @property
+    def size(self):
+        '''
+        Number of values held in the sketch.
+        '''
+        return sum(level.size for level in self._levels)
+
+    @property
+    def rank_error(self):
+        '''
+        Bound on the error of `cdf` for any value, as a fraction of the
+        number of values added. At most (floor(log2(n / k)) + 1) / k.
+        '''
+        if self.n == 0:
+            return 0.0
+        return self._rank_error / float(self.n)
+
+    def cdf(self, values):
+        '''
+        Approximate empirical CDF at the given values. Within `rank_error`
+        of the exact ECDF.
+
+        Parameters
+        ----------
+        values : float or numpy.ndarray
+            Values to evaluate the CDF at.
+        '''
+
+        items, cum_weights = self._weighted_items()
+
+        posns = np.searchsorted(items, values, side='right')
+
+        cum_weights = np.append(0., cum_weights)
+
+        return cum_weights[posns] / float(self.n)
+
+    def quantile(self, quantiles):
+        '''
+        Approximate values at the given quantiles. The rank of each
+        returned value is within `rank_error` of the requested quantile.
+
+        Parameters
+        ----------
+        quantiles : float or numpy.ndarray
+            Quantiles between 0 and 1.
+        '''
+
+        items, cum_weights = self._weighted_items()
+
+        posns = np.searchsorted(cum_weights,
+                                np.asarray(quantiles) * self.n, side='left')
+        posns = np.clip(posns, 0, items.size - 1)
+
+        return items[posns]
+
+
+def sketch_ks_2samp(sketch1, sketch2):
+    '''
+    Two-sample KS test from two quantile sketches. The statistic is the
+    largest difference between the approximate ECDFs, which is within the
+    sum of the two rank error bounds of the exact statistic. The p-value is
+    computed as in `scipy.stats.ks_2samp`.
+
+    Parameters
+    ----------
+    sketch1 : QuantileSketch
+        Sketch of the first sample.
+    sketch2 : QuantileSketch
+        Sketch of the second sample.
+
+    Returns
+    -------
+    D : float
+        Approximate KS statistic.
+    pval : float
+        p-value of the approximate statistic.
+    D_err : float
+        Bound on the error in D.
+    '''
+
+    items1 = sketch1._weighted_items()[0]
+    items2 = sketch2._weighted_items()[0]
+
+    # Both ECDFs are step functions that only change at the sketch values.
+    all_items = np.concatenate([items1, items2])
+
+    D = np.max(np.abs(sketch1.cdf(all_items) - sketch2.cdf(all_items)))
+
+    pval = _ks_2samp_pval(D, sketch1.n, sketch2.n)
+
+    D_err = sketch1.rank_error + sketch2.rank_error
+
+    return D, pval, D_err
+
+
+def _ks_2samp_pval(D, n1, n2):
+    '''
+    Asymptotic p-value of the two-sample KS statistic, as in
+    `scipy.stats.ks_2samp`.
+    '''
+
+    n1 = float(n1)
+    n2 = float(n2)
+    en = np.sqrt(n1 * n2 / (n1 + n2))
+
+    return distributions.kstwobign.sf((en + 0.12 + 0.11 / en) * D)
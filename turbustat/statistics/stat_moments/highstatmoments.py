@@ -2,6 +2,7 @@
 
 
 import numpy as np
+from copy import copy
 from astropy.wcs import WCS
 
 from ..stats_utils import (hellinger, kl_divergence, common_histogram_bins,
@@ -67,11 +68,31 @@ class StatMoments(BaseStatisticMixIn):
         self.mean, self.variance, self.skewness, self.kurtosis =\
             compute_moments(self.data)
 
-    def compute_spatial_distrib(self):
+    def compute_spatial_distrib(self, use_fft=False):
         '''
         Compute the moments over circular region with the specified radius.
+
+        Parameters
+        ----------
+        use_fft : bool, optional
+            Compute the local sums of x, x^2, x^3, x^4 and the number of
+            finite pixels in each circle by FFT convolution, then find the
+            moments in closed form. This avoids looping over every pixel.
+            The data is standardized before the powers are taken to limit
+            round-off in the closed-form moments. Pixels where the local
+            variance is too small for the closed form to be accurate are
+            recomputed directly.
         '''
 
+        if use_fft:
+            power_ffts = _moment_power_ffts(self.data, self.periodic_flag,
+                                            self.radius)
+
+            self.mean_array, self.variance_array, self.skewness_array, \
+                self.kurtosis_array = _local_moments(power_ffts,
+                                                     self.radius)
+            return
+
         if self.periodic_flag:
             pad_img = np.pad(self.data, self.radius, mode="wrap")
         else:
@@ -123,6 +144,54 @@ class StatMoments(BaseStatisticMixIn):
     def kurtosis_extrema(self):
         return np.nanmin(self.kurtosis_array), np.nanmax(self.kurtosis_array)
 
+    def compute_radius_sweep(self, radii, kwargs={}):
+        '''
+        Compute the moment arrays and their histograms for several radii.
+        The powers of the image and the finite mask are transformed once and
+        each radius only needs a kernel multiply and an inverse FFT.
+
+        Parameters
+        ----------
+        radii : list or array
+            Radii of the circular regions.
+        kwargs : dict, optional
+            Passed to `make_spatial_histograms` for every radius.
+        '''
+
+        radii = np.asarray(radii, dtype=int)
+
+        power_ffts = _moment_power_ffts(self.data, self.periodic_flag,
+                                        radii.max())
+
+        self.sweep_radii = radii
+
+        moment_arrays = [[], [], [], []]
+        self.sweep_mean_hists = []
+        self.sweep_variance_hists = []
+        self.sweep_skewness_hists = []
+        self.sweep_kurtosis_hists = []
+
+        for radius in radii:
+            arrays = _local_moments(power_ffts, radius)
+
+            for moment_array, arr in zip(moment_arrays, arrays):
+                moment_array.append(arr)
+
+            moments = copy(self)
+            moments.radius = radius
+            moments.mean_array, moments.variance_array, \
+                moments.skewness_array, moments.kurtosis_array = arrays
+            moments.make_spatial_histograms(**kwargs)
+
+            self.sweep_mean_hists.append(moments.mean_hist)
+            self.sweep_variance_hists.append(moments.variance_hist)
+            self.sweep_skewness_hists.append(moments.skewness_hist)
+            self.sweep_kurtosis_hists.append(moments.kurtosis_hist)
+
+        self.sweep_mean_arrays, self.sweep_variance_arrays, \
+            self.sweep_skewness_arrays, self.sweep_kurtosis_arrays = \
+            [np.array(moment_array) for moment_array in moment_arrays]
+
     def make_spatial_histograms(self, mean_bins=None, variance_bins=None,
                                 skewness_bins=None, kurtosis_bins=None):
         '''
@@ -174,7 +243,7 @@ class StatMoments(BaseStatisticMixIn):
         kurt_bin_centres = (edges[:-1] + edges[1:]) / 2
         self.kurtosis_hist = [kurt_bin_centres, kurtosis_hist]
 
-    def run(self, verbose=False, kwargs={}):
+    def run(self, verbose=False, kwargs={}, use_fft=False):
         '''
         Compute the entire method.
 
@@ -185,10 +254,12 @@ class StatMoments(BaseStatisticMixIn):
         kwargs : dict, optional
             Passed to `make_spatial_histograms`. Bins to use in the histograms
             can be given here.
+        use_fft : bool, optional
+            Passed to `compute_spatial_distrib`.
         '''
 
         self.array_moments()
-        self.compute_spatial_distrib()
+        self.compute_spatial_distrib(use_fft=use_fft)
         self.make_spatial_histograms(**kwargs)
 
         if verbose:
@@ -253,13 +324,17 @@ class StatMoments_Distance(object):
         If image2 is periodic in the spatial boundaries, set to True.
     fiducial_model : StatMoments
         Computed StatMoments object. use to avoid recomputing.
+    use_fft : bool, optional
+        Compute the moment arrays by FFT convolution. See
+        `~StatMoments.compute_spatial_distrib`.
 
     '''
 
     __doc__ %= {"dtypes": " or ".join(common_types + twod_types)}
 
     def __init__(self, image1, image2, radius=5, nbins=None,
-                 periodic1=False, periodic2=False, fiducial_model=None):
+                 periodic1=False, periodic2=False, fiducial_model=None,
+                 use_fft=False):
         super(StatMoments_Distance, self).__init__()
 
         image1 = input_data(image1, no_header=False)
@@ -288,11 +363,11 @@ class StatMoments_Distance(object):
         else:
             self.moments1 = StatMoments(image1, radius1, nbins=self.nbins,
                                         periodic=periodic1)
-            self.moments1.compute_spatial_distrib()
+            self.moments1.compute_spatial_distrib(use_fft=use_fft)
 
         self.moments2 = StatMoments(image2, radius2, nbins=self.nbins,
                                     periodic=periodic1)
-        self.moments2.compute_spatial_distrib()
+        self.moments2.compute_spatial_distrib(use_fft=use_fft)
 
     def create_common_histograms(self, nbins=None):
         '''
@@ -441,6 +516,156 @@ def compute_moments(img):
     return mean, variance, skewness, kurtosis
 
 
+def _moment_power_ffts(img, periodic, max_radius):
+    '''
+    FFTs of the finite mask and the first four powers of the standardized
+    image. NaNs are zero-filled and excluded from the mask. Unless the image
+    is periodic, it is zero-padded by `max_radius` pixels on the upper edges
+    so the convolution does not wrap around for any radius up to
+    `max_radius`.
+
+    Returns
+    -------
+    power_ffts : dict
+        The transforms, along with the standardization, the image and the
+        shapes needed by `_local_moments`.
+    '''
+
+    finite = np.isfinite(img)
+
+    centre = np.nanmean(img)
+    scale = np.nanstd(img)
+    if scale == 0 or not np.isfinite(scale):
+        scale = 1.0
+
+    std_img = np.where(finite, (img - centre) / scale, 0.0)
+
+    pad = 0 if periodic else max_radius
+    padded_shape = (img.shape[0] + pad, img.shape[1] + pad)
+
+    ffts = [np.fft.rfft2(finite.astype(float), s=padded_shape)]
+    for power in range(1, 5):
+        ffts.append(np.fft.rfft2(std_img ** power, s=padded_shape))
+
+    return {"ffts": ffts, "centre": centre, "scale": scale,
+            "max_abs": np.abs(std_img).max(), "img": img,
+            "periodic": periodic, "padded_shape": padded_shape,
+            "shape": img.shape}
+
+
+def _local_moments(power_ffts, radius, tol=1e-6):
+    '''
+    Moment maps over circular regions of the given radius from the output of
+    `_moment_power_ffts`. Follows `compute_moments`: the variance is the
+    population variance, and regions with zero variance have a skewness of
+    0 and a kurtosis of -3.
+
+    The closed-form central moments cancel where the local variance is
+    small compared to the powers of the standardized image (e.g., a nearly
+    flat region next to a bright one). The local mean of z^k from the FFTs
+    is accurate to about eps * max|z|^k * (circle size / count), and the
+    skewness and kurtosis divide this by the variance to the 3/2 and 2.
+    Pixels where the estimated error in either is above `tol` are
+    recomputed directly from their circular regions.
+    '''
+
+    padded_shape = power_ffts["padded_shape"]
+    ny, nx = power_ffts["shape"]
+
+    # Circle offsets folded onto the padded grid, centred on (0, 0).
+    circle = np.isfinite(circular_region(radius))
+    yy, xx = np.nonzero(circle)
+    kernel = np.zeros(padded_shape)
+    np.add.at(kernel, ((yy - radius) % padded_shape[0],
+                       (xx - radius) % padded_shape[1]), 1.0)
+    kernel_fft = np.fft.rfft2(kernel)
+
+    local_sums = [np.fft.irfft2(fft * kernel_fft, s=padded_shape)[:ny, :nx]
+                  for fft in power_ffts["ffts"]]
+
+    counts = np.rint(local_sums[0])
+    empty = counts == 0
+    counts[empty] = np.NaN
+
+    m1, m2, m3, m4 = [sums / counts for sums in local_sums[1:]]
+
+    variance = m2 - m1 ** 2
+
+    # Round-off bound on the local means, with a safety factor for the
+    # terms of the central moments.
+    eps_scale = 16 * np.finfo(float).eps * circle.sum() / counts
+    max_abs = power_ffts["max_abs"]
+    pos_variance = np.maximum(variance, 0)
+
+    with np.errstate(invalid='ignore'):
+        unstable = (variance <= 0) | \
+            (eps_scale * max_abs ** 3 > tol * pos_variance ** 1.5) | \
+            (eps_scale * max_abs ** 4 > tol * pos_variance ** 2)
+    unstable &= ~empty
+    variance[unstable] = 1.0
+
+    std = np.sqrt(variance)
+
+    skewness = (m3 - 3 * m1 * m2 + 2 * m1 ** 3) / std ** 3
+    kurtosis = (m4 - 4 * m1 * m3 + 6 * m1 ** 2 * m2 - 3 * m1 ** 4) / \
+        std ** 4 - 3
+
+    mean = power_ffts["centre"] + power_ffts["scale"] * m1
+    variance = power_ffts["scale"] ** 2 * variance
+
+    posns = np.nonzero(unstable)
+    if posns[0].size > 0:
+        mean[posns], variance[posns], skewness[posns], kurtosis[posns] = \
+            _direct_local_moments(power_ffts["img"], power_ffts["periodic"],
+                                  radius, posns)
+
+    for arr in (mean, variance, skewness, kurtosis):
+        arr[empty] = np.NaN
+
+    return mean, variance, skewness, kurtosis
+
+
+def _direct_local_moments(img, periodic, radius, posns, block_size=4096):
+    '''
+    Moments over the circular regions centred on the given pixels, computed
+    as in `compute_moments`. The regions are gathered in blocks of
+    `block_size` pixels.
+    '''
+
+    if periodic:
+        pad_img = np.pad(img, radius, mode="wrap")
+    else:
+        pad_img = np.pad(img, radius, padwithnans)
+
+    circle = np.isfinite(circular_region(radius))
+    yy, xx = np.nonzero(circle)
+
+    moments = np.empty((4, posns[0].size))
+
+    for start in range(0, posns[0].size, block_size):
+        block = slice(start, start + block_size)
+
+        values = pad_img[posns[0][block, np.newaxis] + yy,
+                         posns[1][block, np.newaxis] + xx]
+
+        count = np.sum(np.isfinite(values), axis=1)
+        mean = np.nanmean(values, axis=1)
+        dev = values - mean[:, np.newaxis]
+        variance = np.nanmean(dev ** 2, axis=1)
+
+        # Zero variance gives 0 / 0, which nansum ignores, as in
+        # compute_moments.
+        with np.errstate(invalid='ignore', divide='ignore'):
+            std_dev = dev / np.sqrt(variance)[:, np.newaxis]
+
+        moments[0, block] = mean
+        moments[1, block] = variance
+        moments[2, block] = np.nansum(std_dev ** 3, axis=1) / count
+        moments[3, block] = np.nansum(std_dev ** 4, axis=1) / count - 3
+
+    return moments
+
+
 def padwithnans(vector, pad_width, iaxis, kwargs):
     vector[:pad_width[0]] = np.NaN
     vector[-pad_width[1]:] = np.NaN
@@ -27,37 +27,41 @@ def intensity_data(cube, p=0.1, noise_lim=0.1, norm=True):
         2D dataset of size (# channels, p * cube.shape[1] * cube.shape[2]).
     '''
     vec_length = int(round(p * cube.shape[1] * cube.shape[2]))
-    intensity_vecs = np.empty((cube.shape[0], vec_length))
-
-    delete_channels = []
 
     if norm:
         maxval = np.nanmax(cube)
     else:
         maxval = 1.0
 
-    for dv in range(cube.shape[0]):
-        vec_vec = cube[dv, :, :]
-        # Remove nans from the slice
-        vel_vec = vec_vec[np.isfinite(vec_vec)]
-        # Apply noise limit
-        vel_vec = vel_vec[vel_vec > noise_lim]
-        vel_vec = np.sort(vel_vec)[::-1]
-        if len(vel_vec) < vec_length:
-            diff = vec_length - len(vel_vec)
-            vel_vec = np.append(vel_vec, [0.0] * diff)
-        else:
-            vel_vec = vel_vec[:vec_length]
-
-        # Return the normalized, shortened vector
-        if maxval != 0.0:
-            intensity_vecs[dv, :] = vel_vec / maxval
-        else:
-            delete_channels.append(dv)
-    # Remove channels
-    intensity_vecs = np.delete(intensity_vecs, delete_channels, axis=0)
-
-    return intensity_vecs
+    # Every channel is removed when the normalization is zero.
+    if maxval == 0.0:
+        return np.empty((0, vec_length))
+
+    flat_cube = cube.reshape((cube.shape[0], -1))
+
+    # Mark NaNs and values below the noise limit so they are never kept.
+    keep = np.isfinite(flat_cube)
+    keep[keep] = flat_cube[keep] > noise_lim
+    flat_cube = np.where(keep, flat_cube, -np.inf)
+
+    # Select the largest values in each channel, then sort only those.
+    num_pix = flat_cube.shape[1]
+    if vec_length < num_pix:
+        flat_cube = np.partition(flat_cube, num_pix - vec_length,
+                                 axis=1)[:, num_pix - vec_length:]
+
+    intensity_vecs = np.sort(flat_cube, axis=1)[:, ::-1]
+
+    # Channels with fewer kept values than vec_length are padded with zeros.
+    intensity_vecs[np.isinf(intensity_vecs)] = 0.0
+
+    if intensity_vecs.shape[1] < vec_length:
+        pad = np.zeros((intensity_vecs.shape[0],
+                        vec_length - intensity_vecs.shape[1]))
+        intensity_vecs = np.hstack([intensity_vecs, pad])
+
+    # Return the normalized, shortened vectors
+    return intensity_vecs / maxval
 
 
 def _format_data(cube, data_format='intensity', num_spec=1000,
@@ -77,12 +81,7 @@ def _format_data(cube, data_format='intensity', num_spec=1000,
         bright_spectra = \
             np.argpartition(mom0.ravel(), -num_spec)[-num_spec:]
 
-        x = np.empty((num_spec,), dtype=int)
-        y = np.empty((num_spec,), dtype=int)
-
-        for i in range(num_spec):
-            x[i] = int(bright_spectra[i] / cube.shape[1])
-            y[i] = int(bright_spectra[i] % cube.shape[2])
+        x, y = np.unravel_index(bright_spectra, mom0.shape)
 
         data_matrix = cube[:, x, y]
 
@@ -97,17 +96,125 @@ def _format_data(cube, data_format='intensity', num_spec=1000,
     return data_matrix
 
 
-def var_cov_cube(cube, mean_sub=False):
+def var_cov_cube(cube, mean_sub=False, n_pix_block=65536):
     '''
     Compute the variance-covariance matrix of a data cube, with proper
     handling of NaNs.
 
+    The matrix is built from blocks of spatial pixels. In each block, the
+    zero-filled data is multiplied by its transpose, and the finite mask is
+    multiplied by its transpose to count the pixels where both channels are
+    finite.
+
     Parameters
     ----------
     cube : numpy.ndarray
         PPV cube. Spectral dimension assumed to be 0th axis.
     mean_sub : bool, optional
         Subtract column means.
+    n_pix_block : int, optional
+        Number of spatial pixels in each block.
+
+    Returns
+    -------
+    cov_matrix : numpy.ndarray
+        Computed covariance matrix.
+    '''
+
+    flat_cube = cube.reshape((cube.shape[0], -1))
+
+    if mean_sub:
+        chan_means = _channel_means(flat_cube, n_pix_block=n_pix_block)
+    else:
+        chan_means = None
+
+    cross_prod, counts = \
+        _cov_accumulate(flat_cube, chan_means=chan_means,
+                        n_pix_block=n_pix_block)
+
+    return _cov_from_sums(cross_prod, counts, mean_sub=mean_sub)
+
+
+def _channel_means(flat_cube, n_pix_block=65536):
+    '''
+    NaN-aware mean of each channel in a (channels, pixels) array, computed
+    over blocks of pixels.
+    '''
+
+    sums = np.zeros(flat_cube.shape[0])
+    counts = np.zeros(flat_cube.shape[0])
+
+    for start in range(0, flat_cube.shape[1], n_pix_block):
+        block = flat_cube[:, start:start + n_pix_block]
+        finite = np.isfinite(block)
+        sums += np.where(finite, block, 0.0).sum(axis=1)
+        counts += finite.sum(axis=1)
+
+    return sums / counts
+
+
+def _cov_accumulate(flat_cube, chan_means=None, n_pix_block=65536,
+                    cross_prod=None, counts=None):
+    '''
+    Accumulate the cross-product and the finite-count matrices of a
+    (channels, pixels) array over blocks of pixels. Existing sums can be
+    passed in to continue the accumulation.
+    '''
+
+    n_chan = flat_cube.shape[0]
+
+    if cross_prod is None:
+        cross_prod = np.zeros((n_chan, n_chan))
+    if counts is None:
+        counts = np.zeros((n_chan, n_chan))
+
+    for start in range(0, flat_cube.shape[1], n_pix_block):
+        block = flat_cube[:, start:start + n_pix_block]
+
+        finite = np.isfinite(block)
+        if chan_means is not None:
+            block = block - chan_means[:, np.newaxis]
+        block = np.where(finite, block, 0.0)
+        finite = finite.astype(np.float64)
+
+        cross_prod += np.dot(block, block.T)
+        counts += np.dot(finite, finite.T)
+
+    return cross_prod, counts
+
+
+def _cov_from_sums(cross_prod, counts, mean_sub=False):
+    '''
+    Normalize the accumulated cross-products by the number of pixels
+    where both channels are finite.
+    '''
+
+    # Apply Bessel's correction when mean subtracting
+    if mean_sub:
+        counts = counts - 1.0
+
+    return cross_prod / counts
+
+
+def var_cov_tiles(cube, mean_sub=False, tile_size=64, n_jobs=1):
+    '''
+    Out-of-core version of `var_cov_cube`. The cube is read in spatial tiles
+    and the cross-product and finite-count matrices are updated with each
+    tile, so only one tile per job is held in memory.
+
+    Parameters
+    ----------
+    cube : numpy.ndarray or SpectralCube
+        PPV cube. Spectral dimension assumed to be 0th axis. Use a
+        `~numpy.memmap` (e.g., the data of a FITS file opened with
+        `memmap=True`) or a `~spectral_cube.SpectralCube` to avoid loading
+        the whole cube.
+    mean_sub : bool, optional
+        Subtract column means. This requires an extra pass over the tiles.
+    tile_size : int, optional
+        Size of the square spatial tiles, in pixels.
+    n_jobs : int, optional
+        Number of threads used to reduce the tiles.
 
     Returns
     -------
@@ -115,46 +222,88 @@ def var_cov_cube(cube, mean_sub=False):
         Computed covariance matrix.
     '''
 
-    n_velchan = cube.shape[0]
+    n_chan = cube.shape[0]
 
-    cov_matrix = np.zeros((n_velchan, n_velchan))
+    tiles = list(_spatial_tiles(cube.shape[1:], tile_size))
 
-    for i, chan in enumerate(_iter_2D(cube)):
-        norm_chan = chan
-        if mean_sub:
-            norm_chan -= np.nanmean(chan)
-        for j, chan2 in enumerate(_iter_2D(cube[:i+1, :, :])):
-            norm_chan2 = chan2
-            if mean_sub:
-                norm_chan2 -= np.nanmean(chan2)
+    if mean_sub:
+        sums, counts = _channel_sums(cube, tiles, n_jobs=n_jobs)
+        chan_means = sums / counts
+    else:
+        chan_means = None
+
+    def tile_cov(tile):
+        flat_tile = _read_tile(cube, *tile)
+        return _cov_accumulate(flat_tile, chan_means=chan_means)
+
+    cross_prod = np.zeros((n_chan, n_chan))
+    counts = np.zeros((n_chan, n_chan))
+    for tile_cross, tile_counts in _map_tiles(tile_cov, tiles, n_jobs):
+        cross_prod += tile_cross
+        counts += tile_counts
 
-            divisor = np.sum(np.isfinite(norm_chan*norm_chan2))
+    return _cov_from_sums(cross_prod, counts, mean_sub=mean_sub)
 
-            # Apply Bessel's correction when mean subtracting
-            if mean_sub:
-                divisor -= 1.0
 
-            cov_matrix[i, j] = \
-                np.nansum(norm_chan*norm_chan2) / divisor
+def _channel_sums(cube, tiles, n_jobs=1):
+    '''
+    NaN-aware sum and finite count of each channel, accumulated over tiles.
+    '''
 
-        # Variances
-        # Divided in half to account for doubling in line below
-        var_divis = np.sum(np.isfinite(norm_chan))
-        if mean_sub:
-            var_divis -= 1.0
+    def tile_sums(tile):
+        flat_tile = _read_tile(cube, *tile)
+        finite = np.isfinite(flat_tile)
+        return (np.where(finite, flat_tile, 0.0).sum(axis=1),
+                finite.sum(axis=1))
 
-        cov_matrix[i, i] = 0.5 * \
-            np.nansum(norm_chan*norm_chan) / var_divis
+    sums = np.zeros(cube.shape[0])
+    counts = np.zeros(cube.shape[0])
+    for tile_sum, tile_count in _map_tiles(tile_sums, tiles, n_jobs):
+        sums += tile_sum
+        counts += tile_count
 
-    cov_matrix = cov_matrix + cov_matrix.T
+    return sums, counts
+
+
+def _spatial_tiles(spatial_shape, tile_size):
+    '''
+    Yield the slices of square spatial tiles covering an image.
+    '''
 
-    return cov_matrix
+    for y0 in range(0, spatial_shape[0], tile_size):
+        for x0 in range(0, spatial_shape[1], tile_size):
+            yield slice(y0, y0 + tile_size), slice(x0, x0 + tile_size)
 
 
-def _iter_2D(arr):
+def _read_tile(cube, yslice, xslice):
     '''
-    Flatten a 3D cube into 2D by its channels.
+    Read a spatial tile from an array or SpectralCube and flatten it to
+    (channels, pixels).
     '''
 
-    for chan in arr.reshape((arr.shape[0], -1)):
-        yield chan.copy()
+    if hasattr(cube, "filled_data"):
+        tile = cube.filled_data[:, yslice, xslice].value
+    else:
+        tile = np.asarray(cube[:, yslice, xslice], dtype=np.float64)
+
+    return tile.reshape((tile.shape[0], -1))
+
+
+def _map_tiles(func, tiles, n_jobs=1):
+    '''
+    Apply a function to each tile, optionally with a pool of threads. Results
+    are returned as they finish.
+    '''
+
+    if n_jobs == 1:
+        for tile in tiles:
+            yield func(tile)
+    else:
+        from multiprocessing.pool import ThreadPool
+
+        pool = ThreadPool(n_jobs)
+        try:
+            for out in pool.imap_unordered(func, tiles):
+                yield out
+        finally:
+            pool.terminate()
@@ -49,36 +49,43 @@ class Tsallis(BaseStatisticMixIn):
         else:
             self.lags = lags
 
-        self.tsallis_arrays = np.empty(
-            (len(self.lags), self.data.shape[0], self.data.shape[1]))
+        self.tsallis_arrays = None
         self.tsallis_distrib = np.empty((len(self.lags), 2, num_bins))
         self.tsallis_fits = np.empty((len(self.lags), 7))
 
-    def make_tsallis(self):
+    def make_tsallis(self, keep_arrays=True):
         '''
         Calculate the Tsallis distribution at each lag.
         We standardize each distribution such that it has a mean of zero and
         variance of one.
+
+        The increments are built from offset slices of the image, so no
+        padded or rolled copies are made. Each increment map is histogrammed
+        as soon as it is made.
+
+        Parameters
+        ----------
+        keep_arrays : bool, optional
+            Keep the standardized increment maps in `tsallis_arrays`. Only the
+            histograms are needed for the fits and the distance, so disabling
+            this avoids holding one image per lag.
         '''
 
+        if keep_arrays:
+            self.tsallis_arrays = np.empty(
+                (len(self.lags), self.data.shape[0], self.data.shape[1]))
+        else:
+            self.tsallis_arrays = None
+
         for i, lag in enumerate(self.lags):
-            if self.periodic:
-                pad_img = self.data
-            else:
-                pad_img = np.pad(self.data, lag, padwithzeros)
-            rolls = np.roll(pad_img, lag, axis=0) +\
-                np.roll(pad_img, (-1) * lag, axis=0) +\
-                np.roll(pad_img, lag, axis=1) +\
-                np.roll(pad_img, (-1) * lag, axis=1)
-
-            #  Remove the padding
-            if self.periodic:
-                clip_resulting = (rolls / 4.) - pad_img
-            else:
-                clip_resulting = (rolls[lag:-lag, lag:-lag] / 4.) -\
-                    pad_img[lag:-lag, lag:-lag]
+            neighbours = _sum_of_neighbours(self.data, lag,
+                                            periodic=self.periodic)
+
+            neighbours /= 4.
+            neighbours -= self.data
+
             # Normalize the data
-            data = standardize(clip_resulting)
+            data = standardize(neighbours)
 
             # Ignore nans for the histogram
             hist, bin_edges = np.histogram(data[~np.isnan(data)],
@@ -87,11 +94,13 @@ class Tsallis(BaseStatisticMixIn):
             normlog_hist = np.log10(hist / np.sum(hist, dtype="float"))
 
             # Keep results
-            self.tsallis_arrays[i, :] = data
+            if keep_arrays:
+                self.tsallis_arrays[i, :] = data
             self.tsallis_distrib[i, 0, :] = bin_centres
             self.tsallis_distrib[i, 1, :] = normlog_hist
 
-    def fit_tsallis(self, sigma_clip=2):
+    def fit_tsallis(self, sigma_clip=2, analytic_jac=False, warm_start=False,
+                    n_jobs=1):
         '''
         Fit the Tsallis distributions.
 
@@ -99,20 +108,45 @@ class Tsallis(BaseStatisticMixIn):
         ----------
         sigma_clip : float
             Sets the sigma value to clip data at.
+        analytic_jac : bool, optional
+            Use the analytic Jacobian of `tsallis_function` rather than
+            numerical derivatives.
+        warm_start : bool, optional
+            Start the fit at each lag from the parameters found at the
+            previous lag. Only used when the fits are run serially.
+        n_jobs : int, optional
+            Number of processes to fit the lags with. Each lag then starts
+            from the default initial guess.
         '''
 
-        for i, dist in enumerate(self.tsallis_distrib):
-            clipped = clip_to_sigma(dist[0], dist[1], sigma=sigma_clip)
-            params, pcov = curve_fit(tsallis_function, clipped[0], clipped[1],
-                                     p0=(-np.max(clipped[1]), 1., 2.),
-                                     maxfev=100 * len(dist[0]))
-            fitted_vals = tsallis_function(clipped[0], *params)
-            self.tsallis_fits[i, :3] = params
-            self.tsallis_fits[i, 3:6] = np.diag(pcov)
-            self.tsallis_fits[i, 6] = chisquare(
-                np.exp(fitted_vals), f_exp=np.exp(clipped[1]), ddof=3)[0]
-
-    def run(self, verbose=False, sigma_clip=2):
+        clipped_dists = [clip_to_sigma(dist[0], dist[1], sigma=sigma_clip)
+                         for dist in self.tsallis_distrib]
+        maxfev = 100 * self.tsallis_distrib.shape[2]
+
+        if n_jobs > 1:
+            from multiprocessing import Pool
+
+            pool = Pool(n_jobs)
+            try:
+                fits = pool.map(_fit_tsallis_lag,
+                                [(clipped, None, analytic_jac, maxfev)
+                                 for clipped in clipped_dists])
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            fits = []
+            p0 = None
+            for clipped in clipped_dists:
+                fits.append(_fit_tsallis_lag((clipped, p0, analytic_jac,
+                                              maxfev)))
+                if warm_start:
+                    p0 = fits[-1][:3]
+
+        self.tsallis_fits[:] = fits
+
+    def run(self, verbose=False, sigma_clip=2, keep_arrays=True,
+            analytic_jac=False, warm_start=False, n_jobs=1):
         '''
         Run all steps.
 
@@ -123,24 +157,34 @@ class Tsallis(BaseStatisticMixIn):
         sigma_clip : float
             Sets the sigma value to clip data at.
             Passed to :func:`fit_tsallis`.
+        keep_arrays : bool, optional
+            Keep the increment maps. Passed to :func:`make_tsallis`.
+        analytic_jac : bool, optional
+            Passed to :func:`fit_tsallis`.
+        warm_start : bool, optional
+            Passed to :func:`fit_tsallis`.
+        n_jobs : int, optional
+            Passed to :func:`fit_tsallis`.
         '''
 
-        self.make_tsallis()
-        self.fit_tsallis(sigma_clip=sigma_clip)
+        self.make_tsallis(keep_arrays=keep_arrays)
+        self.fit_tsallis(sigma_clip=sigma_clip, analytic_jac=analytic_jac,
+                         warm_start=warm_start, n_jobs=n_jobs)
 
         if verbose:
             import matplotlib.pyplot as p
             num = len(self.lags)
 
             i = 1
-            for dist, arr, params in zip(self.tsallis_distrib,
-                                         self.tsallis_arrays,
-                                         self.tsallis_fits):
-
-                p.subplot(num, 2, i)
-                # This doesn't plot the last image
-                p.imshow(arr, origin="lower", interpolation="nearest")
-                p.colorbar()
+            for j, (dist, params) in enumerate(zip(self.tsallis_distrib,
+                                                   self.tsallis_fits)):
+
+                if self.tsallis_arrays is not None:
+                    p.subplot(num, 2, i)
+                    # This doesn't plot the last image
+                    p.imshow(self.tsallis_arrays[j], origin="lower",
+                             interpolation="nearest")
+                    p.colorbar()
                 p.subplot(num, 2, i + 1)
                 p.plot(dist[0], tsallis_function(dist[0], *params), "r")
                 p.plot(dist[0], dist[1], 'rD', label="".join(
@@ -172,12 +216,19 @@ class Tsallis_Distance(object):
         Computed Tsallis object. use to avoid recomputing.
     periodic : bool, optional
         Sets whether the boundaries are periodic.
+    analytic_jac : bool, optional
+        Fit with the analytic Jacobian. See `~Tsallis.fit_tsallis`.
+    warm_start : bool, optional
+        Start each lag's fit from the previous lag's parameters.
+    n_jobs : int, optional
+        Number of processes to fit the lags with.
     '''
 
     __doc__ %= {"dtypes": " or ".join(common_types + twod_types)}
 
     def __init__(self, array1, array2, lags=None, num_bins=500,
-                 fiducial_model=None, periodic=False):
+                 fiducial_model=None, periodic=False, analytic_jac=False,
+                 warm_start=False, n_jobs=1):
         super(Tsallis_Distance, self).__init__()
 
         if fiducial_model is not None:
@@ -185,11 +236,15 @@ class Tsallis_Distance(object):
         else:
             self.tsallis1 = Tsallis(
                 array1, lags=lags, num_bins=num_bins,
-                periodic=periodic).run(verbose=False)
+                periodic=periodic).run(verbose=False, keep_arrays=False,
+                                       analytic_jac=analytic_jac,
+                                       warm_start=warm_start, n_jobs=n_jobs)
 
         self.tsallis2 = Tsallis(
             array2, lags=lags, num_bins=num_bins,
-            periodic=periodic).run(verbose=False)
+            periodic=periodic).run(verbose=False, keep_arrays=False,
+                                   analytic_jac=analytic_jac,
+                                   warm_start=warm_start, n_jobs=n_jobs)
 
         self.distance = None
 
@@ -254,6 +309,68 @@ def tsallis_function(x, *p):
                                       (x ** 2. / wsquare)) + loga)
 
 
+def tsallis_jacobian(x, *p):
+    '''
+    Jacobian of `tsallis_function` with respect to its three parameters.
+
+    Parameters
+    ----------
+    x : numpy.ndarray or list
+        x-data
+    params : list
+        Contains the three parameter values.
+
+    Returns
+    -------
+    jac : numpy.ndarray
+        Array of shape (len(x), 3).
+    '''
+    loga, wsquare, q = p
+    x = np.asarray(x)
+
+    arg = 1 + (q - 1) * (x ** 2. / wsquare)
+    # d log10(arg) = d arg / (arg ln 10)
+    dlog_darg = 1 / (arg * np.log(10))
+
+    jac = np.empty((x.size, 3))
+    jac[:, 0] = -1 / (q - 1)
+    jac[:, 1] = x ** 2. * dlog_darg / wsquare ** 2.
+    jac[:, 2] = (np.log10(arg) + loga) / (q - 1) ** 2. - \
+        (x ** 2. / wsquare) * dlog_darg / (q - 1)
+
+    return jac
+
+
+def _fit_tsallis_lag(args):
+    '''
+    Fit the Tsallis function to one clipped distribution. Returns the
+    parameters, the diagonal of the covariance matrix and the chi-square
+    value. Defined at the module level so it can be used with a pool.
+    '''
+
+    clipped, p0, analytic_jac, maxfev = args
+
+    if p0 is None:
+        p0 = (-np.max(clipped[1]), 1., 2.)
+
+    if analytic_jac:
+        params, pcov = curve_fit(tsallis_function, clipped[0], clipped[1],
+                                 p0=p0, jac=tsallis_jacobian, maxfev=maxfev)
+    else:
+        params, pcov = curve_fit(tsallis_function, clipped[0], clipped[1],
+                                 p0=p0, maxfev=maxfev)
+
+    fitted_vals = tsallis_function(clipped[0], *params)
+
+    fit_vals = np.empty(7)
+    fit_vals[:3] = params
+    fit_vals[3:6] = np.diag(pcov)
+    fit_vals[6] = chisquare(np.exp(fitted_vals), f_exp=np.exp(clipped[1]),
+                            ddof=3)[0]
+
+    return fit_vals
+
+
 def clip_to_sigma(x, y, sigma=2):
     '''
     Clip to values between -2 and 2 sigma.
@@ -275,7 +392,34 @@ def clip_to_sigma(x, y, sigma=2):
     return clip_x[np.isfinite(clip_y)], clip_y[np.isfinite(clip_y)]
 
 
-def padwithzeros(vector, pad_width, iaxis, kwargs):
-    vector[:pad_width[0]] = 0
-    vector[-pad_width[1]:] = 0
-    return vector
+def _sum_of_neighbours(img, lag, periodic=False):
+    '''
+    Sum the four neighbours at +/- lag along each axis using offset slices.
+    Without periodic boundaries, neighbours outside of the image are zero.
+    '''
+
+    ny, nx = img.shape
+
+    neighbours = np.zeros_like(img, dtype=np.float64)
+
+    if periodic:
+        lag_y = lag % ny
+        lag_x = lag % nx
+
+        # Equivalent to np.roll(img, lag) + np.roll(img, -lag) on each axis
+        for shift_y in (lag_y, (ny - lag_y) % ny):
+            neighbours[shift_y:] += img[:ny - shift_y]
+            neighbours[:shift_y] += img[ny - shift_y:]
+        for shift_x in (lag_x, (nx - lag_x) % nx):
+            neighbours[:, shift_x:] += img[:, :nx - shift_x]
+            neighbours[:, :shift_x] += img[:, nx - shift_x:]
+
+    else:
+        if lag < ny:
+            neighbours[lag:] += img[:ny - lag]
+            neighbours[:ny - lag] += img[lag:]
+        if lag < nx:
+            neighbours[:, lag:] += img[:, :nx - lag]
+            neighbours[:, :nx - lag] += img[:, lag:]
+
+    return neighbours
@@ -1,2 +1,3 @@
-from vca import VCA, VCA_Distance
-from vcs import VCS, VCS_Distance
\ No newline at end of file
+from vca import VCA, VCA_Distance
+from vcs import VCS, VCS_Distance
+from power_marginals import compute_power_marginals
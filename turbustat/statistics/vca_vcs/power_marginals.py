@@ -0,0 +1,58 @@
+# Licensed under an MIT open source license - see LICENSE
+
+
+import numpy as np
+from numpy.fft import fftshift
+
+from .vca import _half_to_full_plane
+from ...io import input_data, common_types, threed_types
+
+
+def compute_power_marginals(cube):
+    '''
+    Compute the 3D power spectrum of a cube once and return the two
+    marginals used by VCA and VCS. VCA needs P(kx, ky) summed over kv and
+    VCS needs P(kv) summed over kx and ky. Only the half-space from
+    `~numpy.fft.rfftn` is used; the mirrored half is accounted for with
+    P(-k) = P(k) rather than reconstructed.
+
+    Parameters
+    ----------
+    cube : %(dtypes)s
+        Data cube. NaNs are set to zero, as in `~VCA` and `~VCS`.
+
+    Returns
+    -------
+    spatial_power : numpy.ndarray
+        The 2D power summed over kv, shifted to match `~VCA.ps2D`.
+    spectral_power : numpy.ndarray
+        The 1D power summed over kx and ky, ordered as `~VCS.vel_freqs`.
+        Dividing by the number of good spatial pixels gives `~VCS.ps1D`.
+    '''
+
+    data = input_data(cube, no_header=True)
+
+    if np.isnan(data).any():
+        data = data.copy()
+        data[np.isnan(data)] = 0
+
+    last_dim = data.shape[2]
+
+    ps3D_half = np.abs(np.fft.rfftn(data))**2
+
+    nhalf = ps3D_half.shape[2]
+
+    spatial_power = \
+        fftshift(_half_to_full_plane(ps3D_half.sum(axis=0), last_dim))
+
+    # Columns 1 to last_dim - nhalf are mirrored into the negative kx. The
+    # mirrored power at kv lies at -kv in the half-space.
+    mirrored = ps3D_half[:, :, 1:last_dim - nhalf + 1].sum(axis=(1, 2))
+    spectral_power = ps3D_half.sum(axis=(1, 2))
+    spectral_power += mirrored[(-np.arange(data.shape[0])) % data.shape[0]]
+
+    return spatial_power, spectral_power
+
+
+compute_power_marginals.__doc__ %= \
+    {"dtypes": " or ".join(common_types + threed_types)}
@@ -3,7 +3,8 @@
 
 import numpy as np
 import warnings
-from numpy.fft import fftshift
+from copy import copy
+from numpy.fft import fftshift, rfft2
 import astropy.units as u
 
 from ..rfft_to_fft import rfft_to_fft
@@ -40,6 +41,8 @@ class VCA(BaseStatisticMixIn, StatisticBase_PSpec2D):
 
         if slice_size is None:
             self.slice_size = 1.0
+        else:
+            self.slice_size = slice_size
 
         if slice_size != 1.0:
             self.data = \
@@ -48,17 +51,147 @@ class VCA(BaseStatisticMixIn, StatisticBase_PSpec2D):
 
         self._ps1D_stddev = None
 
-    def compute_pspec(self):
+    def compute_pspec(self, stream=False, chans_per_block=1,
+                      spatial_power=None):
         '''
         Compute the 2D power spectrum.
+
+        Parameters
+        ----------
+        stream : bool, optional
+            Transform blocks of channels in turn and accumulate the 2D power,
+            rather than taking the 3D transform of the whole cube. By
+            Parseval's theorem along the spectral axis, the sum of the 3D
+            power over kv is the number of channels times the summed 2D
+            power of each channel. Peak memory is a few images per channel in
+            the block.
+        chans_per_block : int, optional
+            Number of channels to transform at once when streaming.
+        spatial_power : numpy.ndarray, optional
+            Precomputed 2D power from `~compute_power_marginals`. When given,
+            no transform is taken.
         '''
 
+        if spatial_power is not None:
+            if spatial_power.shape != self.data.shape[1:]:
+                raise ValueError("spatial_power must match the spatial shape"
+                                 " of the cube.")
+            self._ps2D = spatial_power
+            return
+
+        if stream:
+            nchan = self.data.shape[0]
+
+            if chans_per_block < 1:
+                raise ValueError("chans_per_block must be at least 1.")
+
+            self._ps2D = np.zeros(self.data.shape[1:])
+
+            for start in range(0, nchan, chans_per_block):
+                block = self.data[start:start + chans_per_block]
+                self._ps2D += \
+                    (np.abs(np.fft.fft2(block))**2).sum(axis=0)
+
+            self._ps2D = fftshift(self._ps2D) * nchan
+
+            return
+
         vca_fft = fftshift(rfft_to_fft(self.data))
 
         self._ps2D = np.power(vca_fft, 2.).sum(axis=0)
 
+    def compute_slice_thickness_sweep(self, slice_sizes, brk=None,
+                                      return_stddev=True, logspacing=True):
+        '''
+        Compute and fit VCA spectra for a set of slice thicknesses from one
+        pass of channel transforms. Averaging channels is linear, so the
+        transform of a thick slice is the weighted sum of its channel
+        transforms. Thicknesses need not be integers: slice `j` spans
+        channels `j * t` to `(j + 1) * t`, and channels on the edges are
+        weighted by their overlap. Channels beyond the last full slice are
+        dropped. For integer thicknesses that divide the number of channels
+        this matches `change_slice_thickness`.
+
+        Parameters
+        ----------
+        slice_sizes : list or numpy.ndarray
+            Slice thicknesses in channels. Minimum is 1.0.
+        brk : float, list or array, optional
+            Initial guesses for the break point. A list or array gives one
+            guess per thickness.
+        return_stddev : bool, optional
+            Return the standard deviation in the 1D bins.
+        logspacing : bool, optional
+            Return logarithmically spaced bins for the lags.
+        '''
+
+        slice_sizes = np.asarray(slice_sizes, dtype=float)
+
+        if slice_sizes.ndim != 1:
+            raise TypeError("slice_sizes must be a 1D list or array.")
+
+        nchan = self.data.shape[0]
+
+        if (slice_sizes < 1).any() or (slice_sizes > nchan).any():
+            raise ValueError("slice_sizes must be between 1 and the number "
+                             "of channels.")
+
+        if not isinstance(brk, list) and not isinstance(brk, np.ndarray):
+            brk = [brk] * slice_sizes.size
+
+        # Transform each channel once. Only the half-plane is kept.
+        chan_ffts = np.empty((nchan, self.data.shape[1],
+                              self.data.shape[2] // 2 + 1), dtype=complex)
+        for chan in range(nchan):
+            chan_ffts[chan] = rfft2(self.data[chan])
+
+        self.sweep_slice_sizes = slice_sizes
+        self.sweep_ps2D = np.empty((slice_sizes.size,) + self.data.shape[1:])
+        self.sweep_ps1D = []
+        self.sweep_fits = []
+        self.sweep_slopes = np.empty(slice_sizes.size)
+        self.sweep_slope_errs = np.empty(slice_sizes.size)
+
+        for i, size in enumerate(slice_sizes):
+            nslice = int(np.floor(nchan / size + 1e-8))
+
+            half_ps2D = np.zeros(chan_ffts.shape[1:])
+            for j in range(nslice):
+                low = j * size
+                high = (j + 1) * size
+
+                chans = np.arange(int(np.floor(low)),
+                                  min(int(np.ceil(high - 1e-8)), nchan))
+                weights = (np.minimum(chans + 1, high) -
+                           np.maximum(chans, low)) / size
+
+                slice_fft = np.tensordot(weights, chan_ffts[chans], axes=1)
+                half_ps2D += np.abs(slice_fft)**2
+
+            self.sweep_ps2D[i] = \
+                fftshift(_half_to_full_plane(half_ps2D,
+                                             self.data.shape[2])) * nslice
+
+            # Bin and fit on a shallow copy so the main spectrum is kept.
+            sweep_vca = copy(self)
+            sweep_vca._ps2D = self.sweep_ps2D[i]
+            sweep_vca.compute_radial_pspec(return_stddev=return_stddev,
+                                           logspacing=logspacing,
+                                           max_bin=0.5)
+            sweep_vca.fit_pspec(brk=brk[i])
+
+            self.sweep_ps1D.append(sweep_vca.ps1D)
+            self.sweep_fits.append(sweep_vca.fit)
+            self.sweep_slopes[i] = sweep_vca.slope
+            self.sweep_slope_errs[i] = sweep_vca.slope_err
+
+        self.sweep_ps1D = np.array(self.sweep_ps1D)
+
+        return self
+
     def run(self, verbose=False, brk=None, return_stddev=True,
-            logspacing=True, ang_units=False, unit=u.deg):
+            logspacing=True, ang_units=False, unit=u.deg, stream=False,
+            chans_per_block=1, spatial_power=None):
         '''
         Full computation of VCA.
 
@@ -76,9 +209,17 @@ class VCA(BaseStatisticMixIn, StatisticBase_PSpec2D):
             Convert frequencies to angular units using the given header.
         unit : u.Unit, optional
             Choose the angular unit to convert to when ang_units is enabled.
+        stream : bool, optional
+            Accumulate the 2D power one block of channels at a time. See
+            `~VCA.compute_pspec`.
+        chans_per_block : int, optional
+            Number of channels to transform at once when streaming.
+        spatial_power : numpy.ndarray, optional
+            Precomputed 2D power from `~compute_power_marginals`.
         '''
 
-        self.compute_pspec()
+        self.compute_pspec(stream=stream, chans_per_block=chans_per_block,
+                           spatial_power=spatial_power)
         self.compute_radial_pspec(return_stddev=return_stddev, max_bin=0.5)
         self.fit_pspec(brk=brk)
 
@@ -92,6 +233,24 @@ class VCA(BaseStatisticMixIn, StatisticBase_PSpec2D):
         return self
 
 
+def _half_to_full_plane(half_plane, last_dim):
+    '''
+    Expand the power of a real 2D FFT from the half-plane returned by
+    `~numpy.fft.rfft2` to the full plane, using P(-k) = P(k).
+    '''
+
+    nhalf = half_plane.shape[1]
+    ny = half_plane.shape[0]
+
+    full_plane = np.empty((ny, last_dim))
+    full_plane[:, :nhalf] = half_plane
+
+    mirror = half_plane[:, last_dim - nhalf:0:-1]
+    full_plane[:, nhalf:] = mirror[(-np.arange(ny)) % ny]
+
+    return full_plane
+
+
 class VCA_Distance(object):
 
     '''
@@ -112,12 +271,15 @@ class VCA_Distance(object):
         spline. If not specified, no break point will be used.
     fiducial_model : VCA
         Computed VCA object. use to avoid recomputing.
+    power_marginals : list, optional
+        Outputs of `~compute_power_marginals` for each cube, to avoid
+        recomputing the transforms when VCS is also run. Entries may be None.
     '''
 
     __doc__ %= {"dtypes": " or ".join(common_types + threed_types)}
 
     def __init__(self, cube1, cube2, slice_size=1.0, breaks=None,
-                 fiducial_model=None):
+                 fiducial_model=None, power_marginals=None):
         super(VCA_Distance, self).__init__()
 
         assert isinstance(slice_size, float)
@@ -125,14 +287,26 @@ class VCA_Distance(object):
         if not isinstance(breaks, list) and not isinstance(breaks, np.ndarray):
             breaks = [breaks] * 2
 
+        if power_marginals is None:
+            power_marginals = [None] * 2
+
+        # The marginals are only valid for the original channel width.
+        spatial_powers = [None] * 2
+        if slice_size == 1.0:
+            for i, marginals in enumerate(power_marginals):
+                if marginals is not None:
+                    spatial_powers[i] = marginals[0]
+
         if fiducial_model is not None:
             self.vca1 = fiducial_model
         else:
             self.vca1 = \
-                VCA(cube1, slice_size=slice_size).run(brk=breaks[0])
+                VCA(cube1, slice_size=slice_size).run(
+                    brk=breaks[0], spatial_power=spatial_powers[0])
 
         self.vca2 = \
-            VCA(cube2, slice_size=slice_size).run(brk=breaks[1])
+            VCA(cube2, slice_size=slice_size).run(
+                brk=breaks[1], spatial_power=spatial_powers[1])
 
     def distance_metric(self, verbose=False, label1=None, label2=None,
                         ang_units=False, unit=u.deg):
@@ -3,6 +3,7 @@
 
 import numpy as np
 import warnings
+from copy import copy
 from numpy.fft import fftfreq
 from astropy import units as u
 
@@ -62,16 +63,133 @@ class VCS(BaseStatisticMixIn):
         self.vel_freqs = \
             np.abs(fftfreq(self.data.shape[0])) / self.vel_to_pix
 
-    def compute_pspec(self):
+    def compute_pspec(self, spectral_power=None):
         '''
         Take the FFT of each spectrum in velocity dimension.
+
+        Parameters
+        ----------
+        spectral_power : numpy.ndarray, optional
+            Precomputed 1D power from `~compute_power_marginals`. When given,
+            no transform is taken.
         '''
 
+        if spectral_power is not None:
+            if spectral_power.shape != (self.data.shape[0],):
+                raise ValueError("spectral_power must match the spectral "
+                                 "shape of the cube.")
+            self.ps1D = spectral_power / self.good_pixel_count
+            return
+
         ps3D = np.power(rfft_to_fft(self.data), 2.)
         self.ps1D = np.nansum(
             np.nansum(ps3D, axis=2), axis=1) /\
             self.good_pixel_count
 
+    def compute_resolution_sweep(self, channel_widths, breaks=None,
+                                 lg_scale_cut=2, verbose=False,
+                                 n_pix_block=4096):
+        '''
+        Compute and fit the VCS spectrum of the cube binned by each of a set
+        of channel widths, without binning the cube for each width.
+
+        For a width b and N channels, the spectrum of a binned pixel at
+        frequency q collects the b aliases k = q + m N / b of the full
+        resolution spectrum X: Y(q) = sum_m H(k) X(k) / b, where
+        H(k) = sum_l exp(2 pi i k l / N) / b is the response of the boxcar.
+        The aliases are summed coherently before the power is taken, so the
+        result is the spectrum of the binned cube. The spectra of each block
+        of `n_pix_block` pixels are transformed once and used for every
+        width.
+
+        Parameters
+        ----------
+        channel_widths : list or numpy.ndarray
+            Integer channel binning factors. Each must divide the number of
+            channels.
+        breaks : float, list or array, optional
+            Break guesses passed to `fit_pspec`. A list or array gives one
+            guess per width.
+        lg_scale_cut : int, optional
+            Cuts off largest scales, which deviate from the powerlaw.
+        verbose : bool, optional
+            Enables verbose mode in Lm_Seg.
+        n_pix_block : int, optional
+            Number of spatial pixels transformed at once.
+        '''
+
+        channel_widths = np.asarray(channel_widths)
+
+        if channel_widths.ndim != 1:
+            raise TypeError("channel_widths must be a 1D list or array.")
+
+        if (channel_widths < 1).any() or \
+           (channel_widths != channel_widths.astype(int)).any():
+            raise ValueError("channel_widths must be integers of at least 1.")
+
+        channel_widths = channel_widths.astype(int)
+
+        nchan = self.data.shape[0]
+
+        if (nchan % channel_widths != 0).any():
+            raise ValueError("channel_widths must divide the number of "
+                             "channels ({}).".format(nchan))
+
+        if not isinstance(breaks, list) and not isinstance(breaks, np.ndarray):
+            breaks = [breaks] * channel_widths.size
+
+        # Boxcar response of each width, in FFT order.
+        chan_freqs = fftfreq(nchan)
+        responses = []
+        for width in channel_widths:
+            offsets = np.arange(width)
+            responses.append(
+                np.exp(2j * np.pi * np.outer(chan_freqs, offsets)).mean(1))
+
+        sweep_power = [np.zeros(nchan // width) for width in channel_widths]
+
+        flat_data = self.data.reshape((nchan, -1))
+
+        for start in range(0, flat_data.shape[1], n_pix_block):
+            spec_fft = np.fft.fft(flat_data[:, start:start + n_pix_block],
+                                  axis=0)
+
+            for width, response, power in zip(channel_widths, responses,
+                                              sweep_power):
+                # Frequency k = q + m * nbin aliases onto bin q.
+                nbin = nchan // width
+                binned_fft = \
+                    (response[:, np.newaxis] * spec_fft).reshape(
+                        (width, nbin, -1)).sum(0) / width
+                power += (np.abs(binned_fft)**2).sum(1)
+
+        # Parseval over the spatial axes gives the normalization of ps1D.
+        norm = flat_data.shape[1] / float(self.good_pixel_count)
+
+        self.sweep_widths = channel_widths
+        self.sweep_ps1D = []
+        self.sweep_vel_freqs = []
+        self.sweep_fits = []
+
+        for i, width in enumerate(channel_widths):
+            sweep_ps1D = norm * sweep_power[i]
+            sweep_vel_freqs = \
+                np.abs(fftfreq(nchan // width)) / (width * self.vel_to_pix)
+
+            self.sweep_ps1D.append(sweep_ps1D)
+            self.sweep_vel_freqs.append(sweep_vel_freqs)
+
+            # Fit on a shallow copy with the binned spectrum.
+            sweep_vcs = copy(self)
+            sweep_vcs.ps1D = sweep_ps1D
+            sweep_vcs.vel_freqs = sweep_vel_freqs
+            sweep_vcs.fit_pspec(breaks=breaks[i], lg_scale_cut=lg_scale_cut,
+                                verbose=verbose)
+
+            self.sweep_fits.append(sweep_vcs.fit)
+
+        return self
+
     def fit_pspec(self, breaks=None, log_break=True, lg_scale_cut=2,
                   verbose=False):
         '''
@@ -108,6 +226,11 @@ class VCS(BaseStatisticMixIn):
             # The first and last are just the min and max of x
             breaks = spline.get_knots()[1:-1]
 
+            # Short spectra (e.g., degraded resolution) may give no interior
+            # knots. Start from the middle of the range instead.
+            if breaks.size == 0:
+                breaks = np.array([np.median(spline_x)])
+
             if verbose:
                 print "Breaks found from spline are: " + str(breaks)
 
@@ -130,7 +253,7 @@ class VCS(BaseStatisticMixIn):
                 if self.fit.params.size == 5:
                     break
                 i += 1
-                if i >= breaks.shape:
+                if i >= breaks.size:
                     warnings.warn("No good break point found. Returned fit\
                                    does not include a break!")
                     break
@@ -161,7 +284,7 @@ class VCS(BaseStatisticMixIn):
     def brk_err(self):
         return self.fit.brk_err
 
-    def run(self, verbose=False, breaks=None):
+    def run(self, verbose=False, breaks=None, spectral_power=None):
         '''
         Run the entire computation.
 
@@ -172,8 +295,10 @@ class VCS(BaseStatisticMixIn):
         breaks : float, optional
             Specify where the break point is. If None, attempts to find using
             spline.
+        spectral_power : numpy.ndarray, optional
+            Precomputed 1D power from `~compute_power_marginals`.
         '''
-        self.compute_pspec()
+        self.compute_pspec(spectral_power=spectral_power)
         self.fit_pspec(verbose=verbose, breaks=breaks)
 
         if verbose:
@@ -219,12 +344,15 @@ class VCS_Distance(object):
         Computed VCS object. use to avoid recomputing.
     vel_units : bool, optional
         Convert frequencies to the spectral unit in the headers.
+    power_marginals : list, optional
+        Outputs of `~compute_power_marginals` for each cube, to avoid
+        recomputing the transforms when VCA is also run. Entries may be None.
     '''
 
     __doc__ %= {"dtypes": " or ".join(common_types + threed_types)}
 
     def __init__(self, cube1, cube2, breaks=None, fiducial_model=None,
-                 vel_units=False):
+                 vel_units=False, power_marginals=None):
         super(VCS_Distance, self).__init__()
 
         self.vel_units = vel_units
@@ -232,14 +360,24 @@ class VCS_Distance(object):
         if not isinstance(breaks, list) and not isinstance(breaks, np.ndarray):
             breaks = [breaks] * 2
 
+        if power_marginals is None:
+            power_marginals = [None] * 2
+
+        spectral_powers = [None if marginals is None else marginals[1]
+                           for marginals in power_marginals]
+
         if fiducial_model is not None:
             self.vcs1 = fiducial_model
         else:
             self.vcs1 = VCS(cube1,
-                            vel_units=vel_units).run(breaks=breaks[0])
+                            vel_units=vel_units).run(
+                                breaks=breaks[0],
+                                spectral_power=spectral_powers[0])
 
         self.vcs2 = VCS(cube2,
-                        vel_units=vel_units).run(breaks=breaks[1])
+                        vel_units=vel_units).run(
+                            breaks=breaks[1],
+                            spectral_power=spectral_powers[1])
 
     def distance_metric(self, verbose=False, label1=None, label2=None):
         '''
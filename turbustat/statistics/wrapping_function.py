@@ -9,7 +9,7 @@ from .mvc import MVC_Distance
 from .pspec_bispec import PSpec_Distance, BiSpectrum_Distance
 from .genus import GenusDistance
 from .delta_variance import DeltaVariance_Distance
-from .vca_vcs import VCA_Distance, VCS_Distance
+from .vca_vcs import VCA_Distance, VCS_Distance, compute_power_marginals
 from .tsallis import Tsallis_Distance
 from .stat_moments import StatMoments_Distance
 from .pca import PCA_Distance
@@ -58,6 +58,11 @@ def stats_wrapper(dataset1, dataset2, fiducial_models=None,
 
     distances = {}
 
+    # VCA and VCS are marginals of the same 3D power spectrum. When both are
+    # requested, compute it once per cube.
+    run_vca_vcs = any("VCS" in s for s in statistics) and \
+        any("VCA" in s for s in statistics)
+
     # Calculate the fiducial case and return it for later use
     if fiducial_models is None:
 
@@ -131,10 +136,18 @@ def stats_wrapper(dataset1, dataset2, fiducial_models=None,
             if cleanup:
                 del genus_distance
 
+        if run_vca_vcs:
+            power_marginals = [compute_power_marginals(dataset1["cube"]),
+                               compute_power_marginals(dataset2["cube"])]
+        else:
+            power_marginals = None
+
         if any("VCS" in s for s in statistics):
-            vcs_distance = VCS_Distance(dataset1["cube"],
-                                        dataset2["cube"],
-                                        breaks=vcs_break).distance_metric()
+            vcs_distance = \
+                VCS_Distance(dataset1["cube"],
+                             dataset2["cube"],
+                             breaks=vcs_break,
+                             power_marginals=power_marginals).distance_metric()
             distances["VCS"] = vcs_distance.distance
             distances["VCS_Small_Scale"] = vcs_distance.small_scale_distance
             distances["VCS_Large_Scale"] = vcs_distance.large_scale_distance
@@ -147,9 +160,11 @@ def stats_wrapper(dataset1, dataset2, fiducial_models=None,
                 del vcs_distance
 
         if any("VCA" in s for s in statistics):
-            vca_distance = VCA_Distance(dataset1["cube"],
-                                        dataset2["cube"],
-                                        breaks=vca_break).distance_metric()
+            vca_distance = \
+                VCA_Distance(dataset1["cube"],
+                             dataset2["cube"],
+                             breaks=vca_break,
+                             power_marginals=power_marginals).distance_metric()
             distances["VCA"] = vca_distance.distance
             if not multicore:
                 fiducial_models["VCA"] = vca_distance.vca1
@@ -336,12 +351,19 @@ def stats_wrapper(dataset1, dataset2, fiducial_models=None,
             if cleanup:
                 del genus_distance
 
+        if run_vca_vcs:
+            power_marginals = [None,
+                               compute_power_marginals(dataset2["cube"])]
+        else:
+            power_marginals = None
+
         if any("VCS" in s for s in statistics):
             vcs_distance = \
                 VCS_Distance(dataset1["cube"],
                              dataset2["cube"],
                              fiducial_model=fiducial_models["VCS"],
-                             breaks=vcs_break).distance_metric()
+                             breaks=vcs_break,
+                             power_marginals=power_marginals).distance_metric()
             distances["VCS_Small_Scale"] = vcs_distance.small_scale_distance
             distances["VCS_Large_Scale"] = vcs_distance.large_scale_distance
             distances["VCS_Break"] = vcs_distance.break_distance
@@ -355,7 +377,8 @@ def stats_wrapper(dataset1, dataset2, fiducial_models=None,
                 VCA_Distance(dataset1["cube"],
                              dataset2["cube"],
                              fiducial_model=fiducial_models["VCA"],
-                             breaks=vca_break).distance_metric()
+                             breaks=vca_break,
+                             power_marginals=power_marginals).distance_metric()
             distances["VCA"] = vca_distance.distance
 
             if cleanup:
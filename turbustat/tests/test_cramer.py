@@ -6,11 +6,13 @@ Test functions for Cramer
 '''
 
 from unittest import TestCase
+from collections import Counter
 
 import numpy as np
 import numpy.testing as npt
 
 from ..statistics import Cramer_Distance
+from ..statistics.threeD_to_twoD import _format_data
 from ._testing_data import \
     dataset1, dataset2, computed_data, computed_distances
 
@@ -36,3 +38,59 @@ class testCramer(TestCase):
         self.tester3.distance_metric()
 
         npt.assert_almost_equal(self.tester2.distance, self.tester3.distance)
+
+    def test_cramer_format_spatial_diff(self):
+        np.random.seed(1234)
+        large_cube = np.random.rand(10, 20, 20)
+        small_cube = np.random.rand(10, 12, 14)
+
+        # 10% of the pixels are kept in each channel.
+        for cube1, cube2 in [(large_cube, small_cube),
+                             (small_cube, large_cube)]:
+            self.tester = Cramer_Distance(cube1, cube2)
+            self.tester.format_data()
+
+            assert self.tester.data_matrix1.shape == (10, 17)
+            assert self.tester.data_matrix2.shape == (10, 17)
+
+            # Each subsampled row is drawn from its full row.
+            full_matrix = _format_data(large_cube, noise_lim=0.1)
+            if cube1 is large_cube:
+                sampled_matrix = self.tester.data_matrix1
+            else:
+                sampled_matrix = self.tester.data_matrix2
+
+            for row, full_row in zip(sampled_matrix, full_matrix):
+                assert not Counter(row) - Counter(full_row)
+
+    def test_cramer_blocks(self):
+        self.tester = Cramer_Distance(dataset1["cube"], dataset2["cube"])
+        self.tester.format_data()
+        self.tester.cramer_statistic(block_size=3)
+
+        npt.assert_almost_equal(self.tester.distance,
+                                computed_distances['cramer_distance'])
+
+        self.tester = Cramer_Distance(dataset1["cube"], dataset2["cube"])
+        self.tester.distance_metric(block_size=3)
+
+        npt.assert_almost_equal(self.tester.distance,
+                                computed_distances['cramer_distance'])
+
+    def test_cramer_permutation(self):
+        self.tester = Cramer_Distance(dataset1["cube"], dataset2["cube"])
+        self.tester.format_data()
+        self.tester.permutation_test(n_permutations=50, batch_size=20,
+                                     seed=0)
+
+        assert self.tester.permutation_distances.size == 50
+        assert 0 < self.tester.permutation_pval <= 1
+
+    def test_cramer_projection(self):
+        self.tester = Cramer_Distance(dataset1["cube"], dataset2["cube"])
+        self.tester.distance_metric(method='projection', n_projections=512,
+                                    seed=0)
+
+        npt.assert_allclose(self.tester.distance,
+                            computed_distances['cramer_distance'],
+                            atol=5 * self.tester.distance_err)
@@ -7,6 +7,9 @@ Tests for Dendrogram statistics
 
 from unittest import TestCase
 
+import os
+import cPickle as pickle
+from tempfile import mkdtemp
 import numpy as np
 import numpy.testing as npt
 
@@ -40,3 +43,55 @@ class testDendrograms(TestCase):
                                 computed_distances["dendrohist_distance"])
         npt.assert_almost_equal(self.tester_dist.num_distance,
                                 computed_distances["dendronum_distance"])
+
+    def test_DendroStat_thresholds(self):
+
+        self.tester = Dendrogram_Stats(dataset1["cube"],
+                                       min_deltas=self.min_deltas)
+        self.tester.compute_dendro()
+
+        self.tester_seq = Dendrogram_Stats(dataset1["cube"],
+                                           min_deltas=self.min_deltas)
+        self.tester_seq.compute_dendro(sequential_prune=True)
+
+        npt.assert_allclose(self.tester.numfeatures,
+                            self.tester_seq.numfeatures)
+
+        for vals, vals_seq in zip(self.tester.values,
+                                  self.tester_seq.values):
+            npt.assert_allclose(np.sort(vals), np.sort(vals_seq))
+
+    def test_DendroStat_value_layout(self):
+
+        self.tester = Dendrogram_Stats(dataset1["cube"],
+                                       min_deltas=self.min_deltas)
+        self.tester.compute_dendro()
+
+        npt.assert_equal(np.diff(self.tester.value_offsets),
+                         self.tester.numfeatures)
+        assert self.tester.value_array.size == self.tester.value_offsets[-1]
+
+    def test_DendroStat_load_old_values(self):
+
+        self.tester = Dendrogram_Stats(dataset1["cube"],
+                                       min_deltas=self.min_deltas)
+        self.tester.compute_dendro()
+
+        # Pickles saved before value_array existed hold a list of values.
+        old_tester = Dendrogram_Stats.__new__(Dendrogram_Stats)
+        old_tester.__dict__ = self.tester.__dict__.copy()
+        del old_tester.__dict__["value_array"]
+        del old_tester.__dict__["value_offsets"]
+        old_tester.__dict__["values"] = \
+            [list(vals) for vals in self.tester.values]
+
+        pickle_file = os.path.join(mkdtemp(), "old_dendro_stats.pkl")
+        with open(pickle_file, 'wb') as output:
+            pickle.dump(old_tester, output, -1)
+
+        loaded = Dendrogram_Stats.load_results(pickle_file)
+        os.remove(pickle_file)
+
+        npt.assert_equal(loaded.value_offsets, self.tester.value_offsets)
+        for vals, vals_loaded in zip(self.tester.values, loaded.values):
+            npt.assert_allclose(vals_loaded, vals)
@@ -0,0 +1,90 @@
+# Licensed under an MIT open source license - see LICENSE
+
+
+'''
+Test functions for Mahalanobis
+'''
+
+from unittest import TestCase
+
+import numpy as np
+import numpy.testing as npt
+from scipy.spatial.distance import mahalanobis
+
+from ..statistics import Mahalanobis, Mahalanobis_Distance
+from ..statistics.mahalanobis.mahalanobis import shared_mahala_distmat
+from ..statistics.threeD_to_twoD import _format_data
+from ._testing_data import dataset1
+
+
+class testMahalanobis(TestCase):
+
+    def test_shared_distmat(self):
+        np.random.seed(1234)
+        data = np.random.randn(40, 6) * np.arange(1, 7)
+
+        cov = np.cov(data.T, bias=True)
+        mu = np.trace(cov) / cov.shape[0]
+
+        for shrinkage in [0., 0.3]:
+            shrunk_cov = (1 - shrinkage) * cov + \
+                shrinkage * mu * np.eye(cov.shape[0])
+            icov = np.linalg.inv(shrunk_cov)
+
+            expected = np.array([[mahalanobis(x, y, icov) for y in data]
+                                 for x in data])
+
+            npt.assert_allclose(shared_mahala_distmat(data,
+                                                      shrinkage=shrinkage),
+                                expected, atol=1e-10)
+
+    def test_shared_distmat_singular(self):
+        np.random.seed(1234)
+        data = np.random.randn(10, 20)
+
+        self.assertRaises(ValueError, shared_mahala_distmat, data,
+                          shrinkage=0.)
+
+    def test_shared_spectra(self):
+        # Fewer channels than spectra, so the sample covariance is singular.
+        cube = dataset1["cube"][0][::20]
+
+        self.tester = Mahalanobis(cube).run(False, 'spectra', 50,
+                                            method='shared')
+
+        assert self.tester.distance_matrix.shape == (cube.shape[0],
+                                                     cube.shape[0])
+
+        dists = self.tester.distance_matrix[np.triu_indices(cube.shape[0],
+                                                            k=1)]
+        assert dists.std() > 0.1 * dists.mean()
+
+    def test_distance_kwargs(self):
+        cube1 = dataset1["cube"][0][::20]
+        cube2 = dataset1["cube"][0][10::20]
+
+        self.tester = Mahalanobis_Distance(cube1, cube2)
+        self.tester.compute_distmats(data_format='spectra', num_spec=30,
+                                     method='shared', shrinkage=0.5)
+
+        # num_spec sets the number of spectra in each data matrix.
+        assert self.tester.mahala1.data_matrix.shape == (cube1.shape[0], 30)
+        assert self.tester.mahala2.data_matrix.shape == (cube2.shape[0], 30)
+
+        npt.assert_allclose(self.tester.mahala1.distance_matrix,
+                            shared_mahala_distmat(
+                                self.tester.mahala1.data_matrix,
+                                shrinkage=0.5))
+
+    def test_format_spectra_posns(self):
+        cube = np.zeros((5, 3, 7))
+
+        posns = [(0, 6), (2, 1), (1, 4)]
+        for i, (y, x) in enumerate(posns):
+            cube[:, y, x] = (i + 1) * np.arange(1, 6)
+
+        data_matrix = _format_data(cube, 'spectra', 3)
+
+        order = np.argsort(data_matrix.sum(0))
+        for i, (y, x) in enumerate(posns):
+            npt.assert_equal(data_matrix[:, order[i]], cube[:, y, x])
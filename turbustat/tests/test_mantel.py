@@ -0,0 +1,87 @@
+# Licensed under an MIT open source license - see LICENSE
+
+
+'''
+Test functions for the Mantel test
+'''
+
+from unittest import TestCase
+
+import numpy as np
+import numpy.testing as npt
+from scipy.spatial.distance import pdist, squareform
+from scipy.stats import pearsonr, spearmanr
+
+from ..statistics.mantel import mantel_test
+
+
+def _brute_force_mantel(dist1, dist2, corr_func, nperm, seed, pval_type,
+                        batch_size):
+    '''
+    Permute the full matrix for every permutation, drawing the permutations
+    in the same order as mantel_test.
+    '''
+
+    dist2_flat = squareform(dist2)
+
+    orig_cor = corr_func(squareform(dist1), dist2_flat)[0]
+
+    size = dist1.shape[0]
+    rng = np.random.RandomState(seed)
+
+    perm_cors = []
+    for start in range(0, nperm, batch_size):
+        num = min(batch_size, nperm - start)
+        for perm in np.argsort(rng.random_sample((num, size)), axis=1):
+            perm_dist1 = dist1[perm][:, perm]
+            perm_cors.append(corr_func(squareform(perm_dist1),
+                                       dist2_flat)[0])
+    perm_cors = np.array(perm_cors)
+
+    if pval_type == 'two-tail':
+        n_higher = (np.abs(perm_cors) >= np.abs(orig_cor)).sum()
+    elif pval_type == 'greater':
+        n_higher = (perm_cors >= orig_cor).sum()
+    else:
+        n_higher = (perm_cors <= orig_cor).sum()
+
+    return orig_cor, (n_higher + 1) / float(nperm + 1)
+
+
+class testMantel(TestCase):
+
+    def setUp(self):
+        # Unrelated point sets, so the p-values are not all at the limit.
+        np.random.seed(1234)
+        self.dist1 = squareform(pdist(np.random.randn(20, 3)))
+        self.dist2 = squareform(pdist(np.random.randn(20, 3)))
+
+    def test_mantel_orig_cor(self):
+        for corr_name, corr_func in [('pearson', pearsonr),
+                                     ('spearman', spearmanr)]:
+            orig_cor, pval = mantel_test(self.dist1, self.dist2,
+                                         corr_func=corr_name, nperm=0)
+
+            npt.assert_allclose(orig_cor,
+                                corr_func(squareform(self.dist1),
+                                          squareform(self.dist2))[0])
+            assert np.isnan(pval)
+
+    def test_mantel_pval(self):
+        for corr_name, corr_func in [('pearson', pearsonr),
+                                     ('spearman', spearmanr)]:
+            for pval_type in ['greater', 'less', 'two-tail']:
+                orig_cor, pval = \
+                    _brute_force_mantel(self.dist1, self.dist2, corr_func,
+                                        nperm=250, seed=0,
+                                        pval_type=pval_type, batch_size=40)
+
+                for n_jobs in [1, 2]:
+                    test_cor, test_pval = \
+                        mantel_test(self.dist1, self.dist2,
+                                    corr_func=corr_name, nperm=250, seed=0,
+                                    pval_type=pval_type, batch_size=40,
+                                    n_jobs=n_jobs)
+
+                    npt.assert_allclose(test_cor, orig_cor)
+                    npt.assert_equal(test_pval, pval)
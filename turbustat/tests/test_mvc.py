@@ -11,6 +11,7 @@ import numpy as np
 import numpy.testing as npt
 
 from ..statistics import MVC, MVC_Distance
+from ..statistics.mvc.mvc import _two_real_fft2
 from ._testing_data import \
     dataset1, dataset2, computed_data, computed_distances
 
@@ -38,3 +39,16 @@ class testMVC(TestCase):
             MVC_Distance(dataset1, dataset2).distance_metric()
         npt.assert_almost_equal(self.tester_dist.distance,
                                 computed_distances['mvc_distance'])
+
+    def test_two_real_fft2(self):
+        np.random.seed(1234)
+
+        # Odd and even sizes place the Nyquist frequency differently.
+        for shape in [(16, 16), (15, 22), (1, 7)]:
+            arr1 = np.random.randn(*shape)
+            arr2 = np.random.randn(*shape)
+
+            fft_arr1, fft_arr2 = _two_real_fft2(arr1, arr2)
+
+            npt.assert_allclose(fft_arr1, np.fft.fft2(arr1), atol=1e-10)
+            npt.assert_allclose(fft_arr2, np.fft.fft2(arr2), atol=1e-10)
@@ -10,6 +10,7 @@ import numpy as np
 import numpy.testing as npt
 
 from ..statistics import PCA, PCA_Distance
+from ..statistics.threeD_to_twoD import var_cov_cube
 from ._testing_data import \
     dataset1, dataset2, computed_data, computed_distances
 
@@ -25,6 +26,66 @@ class testPCA(TestCase):
         self.tester.run(mean_sub=True)
         npt.assert_allclose(self.tester.eigvals, computed_data['pca_val'])
 
+    def test_PCA_eigvecs(self):
+        self.tester = PCA(dataset1["cube"], n_eigs=10)
+        self.tester.run(mean_sub=True, compute_eigvecs=True)
+
+        all_eigvals = np.linalg.eigvalsh(self.tester.cov_matrix)[::-1]
+        npt.assert_allclose(self.tester.eigvals, all_eigvals[:10])
+        npt.assert_allclose(self.tester.total_variance, np.sum(all_eigvals))
+
+        # Check the eigenvectors against the covariance matrix
+        npt.assert_allclose(np.dot(self.tester.cov_matrix,
+                                   self.tester.eigvecs),
+                            self.tester.eigvecs * self.tester.eigvals,
+                            atol=1e-10)
+
+    def test_PCA_out_of_core(self):
+        self.tester = PCA(dataset1["cube"], n_eigs=50)
+        self.tester.run(mean_sub=True)
+
+        self.tester_tiles = PCA(dataset1["cube"], n_eigs=50, out_of_core=True)
+        self.tester_tiles.run(mean_sub=True, tile_size=10, n_jobs=2)
+
+        npt.assert_allclose(self.tester_tiles.cov_matrix,
+                            self.tester.cov_matrix)
+        npt.assert_allclose(self.tester_tiles.eigvals, self.tester.eigvals)
+
+    def test_PCA_randomized(self):
+        self.tester = PCA(dataset1["cube"], n_eigs=10)
+        self.tester.run(mean_sub=True)
+
+        self.tester_rand = PCA(dataset1["cube"], n_eigs=10)
+        self.tester_rand.run(mean_sub=True, method='randomized',
+                             random_seed=0)
+
+        # The residual norms bound the error in the eigenvalues
+        assert (np.abs(self.tester_rand.eigvals - self.tester.eigvals) <=
+                self.tester_rand.eigval_errs).all()
+        npt.assert_allclose(self.tester_rand.total_variance,
+                            self.tester.total_variance)
+
+    def test_PCA_eigenimages(self):
+        self.tester = PCA(dataset1["cube"], n_eigs=5)
+        self.tester.run(mean_sub=False, compute_eigvecs=True)
+        self.tester.compute_eigenimages(tile_size=10)
+
+        cube = dataset1["cube"][0].copy()
+        cube[np.isnan(cube)] = 0.0
+        eigenimages = np.tensordot(self.tester.eigvecs.T, cube, axes=1)
+
+        npt.assert_allclose(self.tester.eigenimages, eigenimages)
+        npt.assert_allclose(self.tester.eigenspectra,
+                            self.tester.eigvecs.T)
+
+    def test_var_cov_cube(self):
+        cube = np.random.random((10, 8, 8))
+
+        # Blocks that do not evenly divide the pixels.
+        cov = var_cov_cube(cube, mean_sub=True, n_pix_block=7)
+
+        npt.assert_allclose(cov, np.cov(cube.reshape((10, -1))))
+
     def test_PCA_distance(self):
         self.tester_dist = \
             PCA_Distance(dataset1["cube"],
@@ -5,7 +5,7 @@ from unittest import TestCase
 import numpy as np
 import numpy.testing as npt
 
-from ..statistics.pdf import PDF, PDF_Distance
+from ..statistics.pdf import PDF, PDF_Distance, QuantileSketch
 
 from ._testing_data import \
     dataset1, dataset2, computed_data, computed_distances
@@ -51,3 +51,75 @@ class testPDF(TestCase):
 
         # npt.assert_almost_equal(self.test_dist.ad_distance,
         #                         computed_distances['pdf_ad_distance'])
+
+    def test_PDF_distance_sketch(self):
+        self.test_dist = \
+            PDF_Distance(self.dataset1["moment0"],
+                         self.dataset2["moment0"],
+                         min_val1=0.05,
+                         min_val2=0.05,
+                         weights1=self.dataset1["moment0_error"][0]**-2.,
+                         weights2=self.dataset2["moment0_error"][0]**-2.)
+        self.test_dist.distance_metric(statistic='ks', use_sketch=True)
+
+        npt.assert_allclose(self.test_dist.ks_distance,
+                            computed_distances['pdf_ks_distance'],
+                            atol=self.test_dist.ks_distance_error)
+
+    def test_quantile_sketch_bound(self):
+        np.random.seed(1234)
+        values = np.random.standard_t(3, 20000)
+        exact_cdf = np.arange(1, values.size + 1) / float(values.size)
+
+        for k in [16, 128]:
+            sketch = QuantileSketch(k=k, random_seed=0)
+            for start in range(0, values.size, 37):
+                sketch.update(values[start:start + 37])
+
+            merged = QuantileSketch(k=k, random_seed=1)
+            merged.update(values[:5000])
+            other = QuantileSketch(k=k, random_seed=2)
+            other.update(values[5000:])
+            merged.merge(other)
+
+            bound = (np.floor(np.log2(values.size / float(k))) + 1) / k
+
+            for sk in [sketch, merged]:
+                assert sk.n == values.size
+                assert sk.rank_error <= bound
+
+                cdf_err = np.abs(sk.cdf(np.sort(values)) - exact_cdf).max()
+                assert cdf_err <= sk.rank_error
+
+    def test_PDF_out_of_core(self):
+        self.test = PDF(self.dataset1["moment0"],
+                        use_standardized=True, min_val=0.05,
+                        weights=self.dataset1["moment0_error"][0]**-2.,
+                        bins=computed_data['pdf_bins'], out_of_core=True,
+                        chunk_size=100)
+        self.test.run(verbose=False)
+
+        npt.assert_almost_equal(self.test.pdf, computed_data["pdf_val"])
+        assert self.test.data is None
+
+    def test_PDF_distance_fiducial(self):
+        self.test_dist = \
+            PDF_Distance(self.dataset1["moment0"],
+                         self.dataset2["moment0"],
+                         min_val1=0.05,
+                         min_val2=0.05,
+                         weights1=self.dataset1["moment0_error"][0]**-2.,
+                         weights2=self.dataset2["moment0_error"][0]**-2.)
+
+        self.test_fid = \
+            PDF_Distance(None,
+                         self.dataset2["moment0"],
+                         min_val2=0.05,
+                         weights2=self.dataset2["moment0_error"][0]**-2.,
+                         fiducial_model=self.test_dist.PDF1)
+        self.test_fid.distance_metric()
+
+        npt.assert_almost_equal(self.test_fid.hellinger_distance,
+                                computed_distances['pdf_hellinger_distance'])
+        npt.assert_almost_equal(self.test_fid.ks_distance,
+                                computed_distances['pdf_ks_distance'])
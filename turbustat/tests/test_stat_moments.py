@@ -40,3 +40,80 @@ class TestMoments(TestCase):
                                 computed_distances['kurtosis_distance'])
         npt.assert_almost_equal(self.tester_dist.skewness_distance,
                                 computed_distances['skewness_distance'])
+
+    def test_moments_fft(self):
+        self.tester = StatMoments(dataset1["moment0"], radius=3)
+        self.tester.compute_spatial_distrib()
+
+        self.tester_fft = StatMoments(dataset1["moment0"], radius=3)
+        self.tester_fft.compute_spatial_distrib(use_fft=True)
+
+        npt.assert_allclose(self.tester_fft.mean_array,
+                            self.tester.mean_array)
+        npt.assert_allclose(self.tester_fft.variance_array,
+                            self.tester.variance_array)
+        npt.assert_allclose(self.tester_fft.skewness_array,
+                            self.tester.skewness_array, atol=1e-6)
+        npt.assert_allclose(self.tester_fft.kurtosis_array,
+                            self.tester.kurtosis_array, atol=1e-6)
+
+    def test_moments_fft_high_dynamic_range(self):
+        # A nearly flat plateau next to a region with a much larger
+        # variance. The closed-form moments cancel on the plateau.
+        np.random.seed(1234)
+        img = 50 * np.random.randn(40, 36)
+        img[:, :18] = 100 + 1e-3 * np.random.randn(40, 18)
+        img[30:, 25:] = 20.
+        img[5:8, 5:25] = np.NaN
+
+        for periodic in [True, False]:
+            self.tester = StatMoments(img, radius=4, periodic=periodic)
+            self.tester.compute_spatial_distrib()
+
+            self.tester_fft = StatMoments(img, radius=4, periodic=periodic)
+            self.tester_fft.compute_spatial_distrib(use_fft=True)
+
+            npt.assert_allclose(self.tester_fft.mean_array,
+                                self.tester.mean_array)
+            npt.assert_allclose(self.tester_fft.variance_array,
+                                self.tester.variance_array, rtol=1e-6)
+            npt.assert_allclose(self.tester_fft.skewness_array,
+                                self.tester.skewness_array, atol=1e-6)
+            npt.assert_allclose(self.tester_fft.kurtosis_array,
+                                self.tester.kurtosis_array, atol=1e-6)
+
+    def test_moments_radius_sweep(self):
+        self.tester = StatMoments(dataset1["moment0"], periodic=False)
+        self.tester.compute_radius_sweep([3, 5])
+
+        for i, radius in enumerate([3, 5]):
+            tester = StatMoments(dataset1["moment0"], radius=radius,
+                                 periodic=False)
+            tester.compute_spatial_distrib(use_fft=True)
+
+            npt.assert_allclose(self.tester.sweep_skewness_arrays[i],
+                                tester.skewness_array, atol=1e-6)
+            npt.assert_allclose(self.tester.sweep_kurtosis_arrays[i],
+                                tester.kurtosis_array, atol=1e-6)
+
+        assert len(self.tester.sweep_kurtosis_hists) == 2
+
+    def test_moments_radius_sweep_high_dynamic_range(self):
+        np.random.seed(1234)
+        img = 50 * np.random.randn(40, 36)
+        img[:, :18] = 100 + 1e-3 * np.random.randn(40, 18)
+        img[30:, 25:] = 20.
+
+        self.tester = StatMoments(img, periodic=False)
+        self.tester.compute_radius_sweep([2, 4])
+
+        for i, radius in enumerate([2, 4]):
+            tester = StatMoments(img, radius=radius, periodic=False)
+            tester.compute_spatial_distrib()
+
+            npt.assert_allclose(self.tester.sweep_variance_arrays[i],
+                                tester.variance_array, rtol=1e-6)
+            npt.assert_allclose(self.tester.sweep_skewness_arrays[i],
+                                tester.skewness_array, atol=1e-6)
+            npt.assert_allclose(self.tester.sweep_kurtosis_arrays[i],
+                                tester.kurtosis_array, atol=1e-6)
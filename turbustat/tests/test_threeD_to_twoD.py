@@ -0,0 +1,72 @@
+# Licensed under an MIT open source license - see LICENSE
+
+
+'''
+Test functions for the 3D to 2D transforms
+'''
+
+from unittest import TestCase
+
+import numpy as np
+import numpy.testing as npt
+
+from ..statistics.threeD_to_twoD import intensity_data
+
+
+def _intensity_data_loop(cube, p=0.1, noise_lim=0.1, norm=True):
+    '''
+    Reference version of intensity_data that handles one channel at a time.
+    '''
+
+    vec_length = int(round(p * cube.shape[1] * cube.shape[2]))
+
+    if norm:
+        maxval = np.nanmax(cube)
+    else:
+        maxval = 1.0
+
+    if maxval == 0.0:
+        return np.empty((0, vec_length))
+
+    intensity_vecs = np.empty((cube.shape[0], vec_length))
+
+    for dv in range(cube.shape[0]):
+        vel_vec = cube[dv][np.isfinite(cube[dv])]
+        vel_vec = np.sort(vel_vec[vel_vec > noise_lim])[::-1]
+
+        if vel_vec.size < vec_length:
+            vel_vec = np.append(vel_vec, np.zeros(vec_length - vel_vec.size))
+        else:
+            vel_vec = vel_vec[:vec_length]
+
+        intensity_vecs[dv] = vel_vec / maxval
+
+    return intensity_vecs
+
+
+class testIntensityData(TestCase):
+
+    def setUp(self):
+        np.random.seed(1234)
+        self.cube = np.random.randn(6, 9, 11) + 0.5
+
+        # NaNs, a channel below the noise limit and one without finite
+        # values.
+        self.cube[0, 2:5, 3:8] = np.NaN
+        self.cube[2] = 0.05
+        self.cube[3] = np.NaN
+
+    def test_intensity_data(self):
+        for p in [0.1, 0.5, 0.95, 1.0]:
+            for noise_lim in [-np.inf, 0.1, 1.0]:
+                for norm in [True, False]:
+                    kwargs = {"p": p, "noise_lim": noise_lim, "norm": norm}
+
+                    npt.assert_allclose(intensity_data(self.cube, **kwargs),
+                                        _intensity_data_loop(self.cube,
+                                                             **kwargs))
+
+    def test_intensity_data_zero_norm(self):
+        cube = np.zeros((3, 4, 4))
+
+        assert intensity_data(cube, p=0.5).shape == (0, 8)
@@ -28,6 +28,22 @@ class testTsallis(TestCase):
         npt.assert_allclose(self.tester.tsallis_fits,
                             computed_data['tsallis_val'], atol=0.01)
 
+    def test_Tsallis_no_arrays(self):
+        self.tester = Tsallis(dataset1["moment0"],
+                              lags=[1, 2, 4, 8, 16], num_bins=100)
+        self.tester.run(keep_arrays=False)
+
+        assert self.tester.tsallis_arrays is None
+        npt.assert_allclose(self.tester.tsallis_fits,
+                            computed_data['tsallis_val'], atol=0.01)
+
+    def test_Tsallis_analytic_jac(self):
+        self.tester = Tsallis(dataset1["moment0"],
+                              lags=[1, 2, 4, 8, 16], num_bins=100)
+        self.tester.run(analytic_jac=True, warm_start=True)
+        npt.assert_allclose(self.tester.tsallis_fits,
+                            computed_data['tsallis_val'], atol=0.01)
+
     def test_Tsallis_distance(self):
         self.tester_dist = \
             Tsallis_Distance(dataset1["moment0"],
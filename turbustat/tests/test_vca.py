@@ -9,7 +9,7 @@ from unittest import TestCase
 import numpy as np
 import numpy.testing as npt
 
-from ..statistics import VCA, VCA_Distance
+from ..statistics import VCA, VCA_Distance, VCS, compute_power_marginals
 from ._testing_data import \
     dataset1, dataset2, computed_data, computed_distances
 
@@ -25,6 +25,45 @@ class testVCA(TestCase):
         self.tester.run()
         npt.assert_allclose(self.tester.ps1D, computed_data['vca_val'])
 
+    def test_VCA_stream(self):
+        self.tester = VCA(dataset1["cube"])
+        self.tester.run()
+
+        self.tester_stream = VCA(dataset1["cube"])
+        self.tester_stream.run(stream=True, chans_per_block=7)
+
+        npt.assert_allclose(self.tester_stream.ps2D, self.tester.ps2D)
+
+    def test_VCA_slice_sweep(self):
+        self.tester = VCA(dataset1["cube"])
+        self.tester.run()
+        self.tester.compute_slice_thickness_sweep([1., 2., 2.5])
+
+        self.tester_thick = VCA(dataset1["cube"], slice_size=2.0)
+        self.tester_thick.run()
+
+        npt.assert_allclose(self.tester.sweep_ps2D[0], self.tester.ps2D)
+        npt.assert_allclose(self.tester.sweep_ps2D[1],
+                            self.tester_thick.ps2D)
+        npt.assert_almost_equal(self.tester.sweep_slopes[1],
+                                self.tester_thick.slope)
+
+    def test_VCA_power_marginals(self):
+        self.tester = VCA(dataset1["cube"])
+        self.tester.run()
+
+        spatial_power, spectral_power = \
+            compute_power_marginals(dataset1["cube"])
+
+        npt.assert_allclose(spatial_power, self.tester.ps2D)
+
+        # The spectral marginal is the unnormalized VCS spectrum, and both
+        # marginals sum to the total 3D power.
+        vcs = VCS(dataset1["cube"])
+        vcs.compute_pspec()
+        npt.assert_allclose(spectral_power / vcs.good_pixel_count, vcs.ps1D)
+        npt.assert_allclose(spectral_power.sum(), spatial_power.sum())
+
     def test_VCA_distance(self):
         self.tester_dist = \
             VCA_Distance(dataset1["cube"],
@@ -9,7 +9,7 @@ from unittest import TestCase
 import numpy as np
 import numpy.testing as npt
 
-from ..statistics import VCS, VCS_Distance
+from ..statistics import VCS, VCS_Distance, VCA, compute_power_marginals
 from ._testing_data import \
     dataset1, dataset2, computed_data, computed_distances
 
@@ -25,6 +25,21 @@ class testVCS(TestCase):
 
         npt.assert_allclose(self.tester.ps1D, computed_data['vcs_val'])
 
+    def test_VCS_power_marginals(self):
+        spatial_power, spectral_power = \
+            compute_power_marginals(dataset1["cube"])
+
+        self.tester = VCS(dataset1["cube"]).run(spectral_power=spectral_power)
+
+        npt.assert_allclose(self.tester.ps1D, computed_data['vcs_val'])
+
+        # The spatial marginal is the VCA spectrum, and both marginals sum
+        # to the total 3D power.
+        vca = VCA(dataset1["cube"])
+        vca.compute_pspec()
+        npt.assert_allclose(spatial_power, vca.ps2D)
+        npt.assert_allclose(spectral_power.sum(), spatial_power.sum())
+
     def test_VCS_distance(self):
         self.tester_dist = \
             VCS_Distance(dataset1["cube"], dataset2["cube"])
@@ -32,3 +47,29 @@ class testVCS(TestCase):
 
         npt.assert_almost_equal(self.tester_dist.distance,
                                 computed_distances['vcs_distance'])
+
+    def test_VCS_resolution_sweep(self):
+        self.tester = VCS(dataset1["cube"]).run()
+        self.tester.compute_resolution_sweep([1, 2])
+
+        # A width of one channel is the original spectrum.
+        npt.assert_allclose(self.tester.sweep_ps1D[0], self.tester.ps1D)
+        npt.assert_allclose(self.tester.sweep_fits[0].slopes,
+                            self.tester.slopes)
+
+    def test_VCS_resolution_sweep_binned(self):
+        cube, header = dataset1["cube"]
+
+        self.tester = VCS(dataset1["cube"]).run()
+        self.tester.compute_resolution_sweep([2])
+
+        binned = cube.reshape((cube.shape[0] // 2, 2) +
+                              cube.shape[1:]).mean(1)
+        binned_tester = VCS((binned, header)).run()
+
+        npt.assert_allclose(self.tester.sweep_ps1D[0], binned_tester.ps1D,
+                            rtol=1e-10)
+        npt.assert_allclose(self.tester.sweep_fits[0].slopes,
+                            binned_tester.slopes)
+        npt.assert_allclose(self.tester.sweep_vel_freqs[0],
+                            binned_tester.vel_freqs / 2.)